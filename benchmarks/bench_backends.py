@@ -0,0 +1,115 @@
+"""
+Compara precisión y latencia de los backends de inferencia del modelo de armas.
+Usa PyTorch como referencia: una caja coincide si tiene IoU >= 0.5 con una
+caja de referencia del mismo frame.
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_backends video.mp4 --backends torch onnx openvino --int8
+"""
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from utils.video_processing import MODEL_ARMAS, cargar_modelo_seguro
+
+
+def leer_frames(video_path, maximo, paso):
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    indice = 0
+    while cap.isOpened() and len(frames) < maximo:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if indice % paso == 0:
+            frames.append(frame)
+        indice += 1
+    cap.release()
+    return frames
+
+
+def iou(a, b):
+    x1, y1 = np.maximum(a[:2], b[:2])
+    x2, y2 = np.minimum(a[2:], b[2:])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0
+
+
+def inferir(modelo, frames):
+    """Devuelve las cajas/confianzas por frame y la latencia de cada inferencia (ms)"""
+    modelo.predict(frames[0], imgsz=640, conf=0.5, verbose=False)  # calentamiento
+    detecciones, latencias = [], []
+    for frame in frames:
+        inicio = time.perf_counter()
+        res = modelo.predict(frame, imgsz=640, conf=0.5, verbose=False)[0]
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        detecciones.append((res.boxes.xyxy.cpu().numpy(), res.boxes.conf.cpu().numpy()))
+    return detecciones, latencias
+
+
+def comparar(referencia, detecciones):
+    coincidencias = total_ref = total_det = 0
+    diferencias_conf = []
+    for (cajas_ref, conf_ref), (cajas, conf) in zip(referencia, detecciones):
+        total_ref += len(cajas_ref)
+        total_det += len(cajas)
+        usadas = set()
+        for i, caja in enumerate(cajas):
+            mejor = max(range(len(cajas_ref)), key=lambda j: iou(caja, cajas_ref[j]), default=None)
+            if mejor is not None and mejor not in usadas and iou(caja, cajas_ref[mejor]) >= 0.5:
+                usadas.add(mejor)
+                coincidencias += 1
+                diferencias_conf.append(abs(float(conf[i]) - float(conf_ref[mejor])))
+    return {
+        "recall": coincidencias / total_ref if total_ref else 1.0,
+        "precision": coincidencias / total_det if total_det else 1.0,
+        "diferencia_confianza": float(np.mean(diferencias_conf)) if diferencias_conf else 0.0,
+        "cajas_referencia": total_ref,
+        "cajas": total_det
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("video")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "openvino"])
+    parser.add_argument("--int8", action="store_true", help="Evaluar también las variantes int8")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--paso", type=int, default=3)
+    parser.add_argument("--salida", help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    frames = leer_frames(args.video, args.frames, args.paso)
+    if not frames:
+        raise SystemExit(f"No se pudieron leer frames de {args.video}")
+
+    variantes = [(b, False) for b in args.backends]
+    if args.int8:
+        variantes += [(b, True) for b in args.backends if b != "torch"]
+
+    referencia, _ = inferir(cargar_modelo_seguro(MODEL_ARMAS, "torch"), frames)
+    resultados = []
+    for backend, int8 in variantes:
+        detecciones, latencias = inferir(cargar_modelo_seguro(MODEL_ARMAS, backend, int8), frames)
+        resultado = {
+            "backend": backend + ("-int8" if int8 else ""),
+            "latencia_media_ms": float(np.mean(latencias)),
+            "latencia_p95_ms": float(np.percentile(latencias, 95)),
+            "fps": 1000 / float(np.mean(latencias)),
+            **comparar(referencia, detecciones)
+        }
+        resultados.append(resultado)
+        print(f"{resultado['backend']:>14}: {resultado['latencia_media_ms']:7.1f} ms "
+              f"({resultado['fps']:5.1f} fps)  recall {resultado['recall']:.3f}  "
+              f"precision {resultado['precision']:.3f}  Δconf {resultado['diferencia_confianza']:.3f}")
+
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump({"video": args.video, "frames": len(frames), "resultados": resultados}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compara calcular_distancia_real (escalar) con calcular_distancias_matriz (vectorizada).
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_distancias --personas 5 20 50 100
+"""
+import argparse
+import time
+
+import numpy as np
+
+from utils.distance_utils import calcular_distancia_real, calcular_distancias_matriz
+
+FORMA_FRAME = (480, 640, 3)
+
+
+def generar_cajas(n, rng):
+    """Cajas de personas aleatorias dentro de un frame 640x480"""
+    x1 = rng.uniform(0, 560, n)
+    y1 = rng.uniform(0, 300, n)
+    ancho = rng.uniform(30, 80, n)
+    alto = rng.uniform(80, 180, n)
+    return np.stack([x1, y1, np.minimum(x1 + ancho, 640), np.minimum(y1 + alto, 480)], axis=1)
+
+
+def escalar(cajas):
+    n = len(cajas)
+    resultado = np.empty((n, n))
+    for i in range(n):
+        for j in range(n):
+            resultado[i, j] = calcular_distancia_real(cajas[i], cajas[j], FORMA_FRAME)
+    return resultado
+
+
+def medir(funcion, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    return (time.perf_counter() - inicio) / repeticiones * 1000, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--personas", type=int, nargs="+", default=[5, 20, 50, 100])
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'N':>5} {'escalar (ms)':>14} {'vectorizado (ms)':>18} {'aceleración':>12}  equivalente")
+    for n in args.personas:
+        cajas = generar_cajas(n, rng)
+        t_escalar, d_escalar = medir(lambda: escalar(cajas), max(1, args.repeticiones // 10))
+        t_vector, d_vector = medir(lambda: calcular_distancias_matriz(cajas, cajas, FORMA_FRAME),
+                                   args.repeticiones)
+        equivalente = np.allclose(d_escalar, d_vector)
+        print(f"{n:>5} {t_escalar:>14.3f} {t_vector:>18.3f} {t_escalar / t_vector:>11.1f}x  {equivalente}")
+        if not equivalente:
+            raise SystemExit(f"Resultados distintos para N={n}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Prueba de carga de main.py con una flota simulada. Cada cámara sube un segmento por
+intervalo a /upload-video y, con cierta probabilidad, presiona pánico (/enviar-alerta),
+publica una resolución (/resoluciones) y pagina /evidencias como lo haría un operador.
+La concurrencia sube por etapas y para cada una se reporta throughput, latencia
+p50/p95/p99 y tasa de error por operación.
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.carga_flota --lanzar-api --camaras 1 5 10 25 --duracion 60 --salida carga.json
+    python -m benchmarks.carga_flota --url http://localhost:8000 --camaras 10 50 --acelerar 5
+Con --lanzar-api se inicia uvicorn main:app en un directorio temporal, con B2 y la UPC en
+servidores stub locales y una base de MongoDB desechable (en --mongo). Al terminar se borran
+el directorio (videos, users.db con la cache de huellas, marcas de prioridad) y la base
+(alertas, resoluciones, ubicaciones, trabajos encolados).
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import requests
+
+from benchmarks.pipeline import generar_clip
+from benchmarks.servidores_stub import ServidorStub
+
+
+class Muestras:
+    """Latencias y resultados de todas las peticiones de una etapa"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.datos = []  # (operacion, segundos, ok, bytes enviados)
+
+    def agregar(self, operacion, segundos, ok, enviados=0):
+        with self.lock:
+            self.datos.append((operacion, segundos, ok, enviados))
+
+
+def peticion(sesion, muestras, operacion, metodo, url, enviados=0, **kwargs):
+    inicio = time.perf_counter()
+    try:
+        response = sesion.request(metodo, url, timeout=60, **kwargs)
+        ok = response.status_code < 400 and "error" not in (response.json() or {})
+    except Exception:
+        response, ok = None, False
+    muestras.agregar(operacion, time.perf_counter() - inicio, ok, enviados)
+    return response if ok else None
+
+
+def camara(n, args, segmento, fin, muestras):
+    """Bucle de una cámara hasta `fin`: un segmento por intervalo más pánico, resoluciones y consultas"""
+    usuario = f"carga{n:03d}"
+    intervalo = args.intervalo / args.acelerar
+    sesion = requests.Session()
+    # Desfase inicial para que las cámaras no suban todas al mismo tiempo
+    time.sleep(random.uniform(0, min(intervalo, 5)))
+
+    while time.time() < fin:
+        inicio = time.time()
+
+        # Bytes finales distintos por subida: si no, la cache de huellas la trata como duplicado
+        contenido = segmento if args.duplicados else segmento + os.urandom(16)
+        peticion(sesion, muestras, "upload", "POST", f"{args.url}/upload-video",
+                 enviados=len(contenido), params={"usuario": usuario},
+                 files={"video": (f"{usuario}.mp4", contenido, "video/mp4")})
+
+        if random.random() < args.prob_panico:
+            peticion(sesion, muestras, "panico", "POST", f"{args.url}/enviar-alerta", json={
+                "tipo": "panico",
+                "timestamp": int(time.time() * 1000),
+                "usuario": usuario
+            })
+
+        if random.random() < args.prob_resolucion:
+            peticion(sesion, muestras, "resolucion", "POST", f"{args.url}/resoluciones", json={
+                "id_evidencia": os.urandom(12).hex(),
+                "resolucion": "Caso cerrado",
+                "fecha_resolucion": datetime.now().strftime("%Y-%m-%d"),
+                "detalles": "Generado por carga_flota"
+            })
+
+        if random.random() < args.prob_consulta:
+            siguiente = None
+            for _ in range(args.paginas):
+                params = {"limite": 20, **({"antes": siguiente} if siguiente else {})}
+                response = peticion(sesion, muestras, "evidencias", "GET", f"{args.url}/evidencias", params=params)
+                siguiente = response.json().get("siguiente") if response is not None else None
+                if not siguiente:
+                    break
+
+        time.sleep(max(0.0, intervalo - (time.time() - inicio)))
+
+
+def percentil(valores, p):
+    return round(float(np.percentile(valores, p)) * 1000, 1) if valores else None
+
+
+def resumir(muestras, camaras, segundos):
+    """Throughput, percentiles (ms) y tasa de error por operación"""
+    operaciones = {}
+    for operacion in sorted({d[0] for d in muestras.datos}):
+        datos = [d for d in muestras.datos if d[0] == operacion]
+        latencias = [d[1] for d in datos]
+        errores = sum(1 for d in datos if not d[2])
+        operaciones[operacion] = {
+            "peticiones": len(datos),
+            "por_segundo": round(len(datos) / segundos, 2),
+            "p50_ms": percentil(latencias, 50),
+            "p95_ms": percentil(latencias, 95),
+            "p99_ms": percentil(latencias, 99),
+            "tasa_error": round(errores / len(datos), 4)
+        }
+    enviados = sum(d[3] for d in muestras.datos if d[2])
+    return {
+        "camaras": camaras,
+        "segundos": round(segundos, 1),
+        "peticiones_por_segundo": round(len(muestras.datos) / segundos, 2),
+        "mb_s_subidos": round(enviados / 1024 / 1024 / segundos, 2),
+        "operaciones": operaciones
+    }
+
+
+def lanzar_api(puerto, stub, directorio, mongo, base):
+    """
+    uvicorn main:app con B2, la UPC y KUNTUR_API_URL apuntando al stub. Corre en `directorio`
+    (ahí quedan data/, users.db y las marcas de prioridad) y guarda en la base `base` de `mongo`.
+    """
+    raiz = os.getcwd()
+    for carpeta in ("static", "templates"):
+        os.symlink(os.path.join(raiz, carpeta), os.path.join(directorio, carpeta))
+    entorno = dict(os.environ,
+                   B2_API_URL=stub.url,
+                   UPC_ENDPOINT=f"{stub.url}/alertas",
+                   KUNTUR_API_URL=stub.url,
+                   MONGO_LOCAL_URI=mongo,
+                   TRABAJOS_MONGO_URI=mongo,
+                   KUNTUR_DB=base,
+                   PYTHONPATH=os.pathsep.join(filter(None, [raiz, os.environ.get("PYTHONPATH")])))
+
+    # uvicorn main:app no crea las tablas SQLite (usuarios y cache de huellas)
+    subprocess.run([sys.executable, "-c", "from utils.db_utils import init_db; init_db()"],
+                   cwd=directorio, env=entorno, check=True, stdout=subprocess.DEVNULL)
+    proceso = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--app-dir", raiz,
+                                "--port", str(puerto), "--log-level", "warning"], cwd=directorio, env=entorno)
+    url = f"http://127.0.0.1:{puerto}"
+    limite = time.time() + 120
+    while time.time() < limite:
+        if proceso.poll() is not None:
+            raise SystemExit("main.py terminó al iniciar")
+        try:
+            if requests.get(f"{url}/metrics", timeout=2).status_code == 200:
+                return proceso, url
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    proceso.terminate()
+    raise SystemExit("main.py no respondió a tiempo")
+
+
+def borrar_base(mongo, base):
+    """Elimina la base desechable de la prueba"""
+    from pymongo import MongoClient
+
+    client = MongoClient(mongo, serverSelectionTimeoutMS=5000)
+    try:
+        client.drop_database(base)
+    except Exception as e:
+        print(f"No se pudo borrar la base {base}: {e}")
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--lanzar-api", action="store_true", help="Iniciar main.py contra servidores stub")
+    parser.add_argument("--puerto-api", type=int, default=8100)
+    parser.add_argument("--mongo", default="mongodb://localhost:27017/",
+                        help="MongoDB donde --lanzar-api crea (y luego borra) su base desechable")
+    parser.add_argument("--camaras", nargs="+", type=int, default=[1, 5, 10, 25], help="Cámaras por etapa")
+    parser.add_argument("--duracion", type=float, default=60, help="Segundos por etapa")
+    parser.add_argument("--segmento", type=float, default=25, help="Duración de cada segmento subido (s)")
+    parser.add_argument("--resolucion", default="640x360")
+    parser.add_argument("--intervalo", type=float, default=25, help="Segundos entre subidas de una cámara")
+    parser.add_argument("--acelerar", type=float, default=1, help="Divide el intervalo (más carga por cámara)")
+    parser.add_argument("--prob-panico", type=float, default=0.05)
+    parser.add_argument("--prob-resolucion", type=float, default=0.05)
+    parser.add_argument("--prob-consulta", type=float, default=0.2)
+    parser.add_argument("--paginas", type=int, default=3)
+    parser.add_argument("--duplicados", action="store_true", help="Subir siempre el mismo contenido")
+    parser.add_argument("--salida", default="carga_flota.json")
+    args = parser.parse_args()
+
+    ancho, alto = map(int, args.resolucion.lower().split("x"))
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = generar_clip(os.path.join(directorio, "segmento.mp4"), ancho, alto, args.segmento)
+        with open(ruta, "rb") as f:
+            segmento = f.read()
+    print(f"Segmento de {args.segmento:g}s ({len(segmento) / 1024 / 1024:.2f} MB)")
+
+    stub = proceso = directorio = None
+    base = f"kuntur_carga_{os.getpid()}"
+    if args.lanzar_api:
+        stub = ServidorStub(guardar_archivos=False).iniciar()
+        directorio = tempfile.mkdtemp(prefix="kuntur_carga_")
+        try:
+            proceso, args.url = lanzar_api(args.puerto_api, stub, directorio, args.mongo, base)
+        except BaseException:
+            stub.detener()
+            shutil.rmtree(directorio, ignore_errors=True)
+            borrar_base(args.mongo, base)
+            raise
+
+    etapas = []
+    try:
+        for camaras in args.camaras:
+            muestras = Muestras()
+            inicio = time.time()
+            with ThreadPoolExecutor(max_workers=camaras) as executor:
+                for futuro in [executor.submit(camara, n, args, segmento, inicio + args.duracion, muestras)
+                               for n in range(camaras)]:
+                    futuro.result()
+            etapa = resumir(muestras, camaras, time.time() - inicio)
+            etapas.append(etapa)
+
+            subida = etapa["operaciones"].get("upload", {})
+            print(f"{camaras:>4} cámaras: {etapa['peticiones_por_segundo']:7.2f} req/s  "
+                  f"{etapa['mb_s_subidos']:6.2f} MB/s  upload p50 {subida.get('p50_ms')} ms  "
+                  f"p95 {subida.get('p95_ms')} ms  p99 {subida.get('p99_ms')} ms  "
+                  f"error {subida.get('tasa_error', 0):.1%}")
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            proceso.wait()
+            # Todo lo que escribió la API: videos, cache de huellas, marcas de prioridad y Mongo
+            shutil.rmtree(directorio, ignore_errors=True)
+            borrar_base(args.mongo, base)
+        if stub is not None:
+            stub.detener()
+
+    reporte = {
+        "fecha": datetime.now().isoformat(),
+        "configuracion": {k: v for k, v in vars(args).items() if k not in ("salida", "mongo")},
+        "tamano_segmento": len(segmento),
+        "stubs": stub.estadisticas() if stub is not None else None,
+        "etapas": etapas
+    }
+    with open(args.salida, "w") as f:
+        json.dump(reporte, f, indent=2)
+    print(f"Resultados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Benchmark offline del pipeline de un clip: procesar_video, subir_video_b2 y procesar_audio.
+Genera clips sintéticos (figuras en movimiento, un "arma" roja a mitad del clip y un tono
+modulado como audio) y los procesa con modelos stub, B2/UPC en un servidor local y MongoDB
+en memoria (o el indicado con --mongo). Reporta fps, latencia por etapa, RSS pico y bytes
+escritos en un JSON comparable entre versiones.
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.pipeline --resoluciones 640x360 1280x720 --duraciones 10 25 --salida base.json
+    python -m benchmarks.pipeline --salida nuevo.json --comparar base.json --tolerancia 0.2
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from benchmarks.servidores_stub import ClienteMongoMemoria, ServidorStub
+
+# Claves de la salida que se comparan con --comparar (menor es mejor)
+METRICAS_COMPARABLES = ("procesar_video_s", "subida_b2_s", "procesar_audio_s", "rss_pico_mb")
+
+
+def generar_clip(ruta, ancho, alto, duracion, fps=15):
+    """Clip MP4 con personas (círculos) en movimiento y un arma (rectángulo rojo) en el tercio central"""
+    sin_audio = ruta + ".video.mp4"
+    writer = cv2.VideoWriter(sin_audio, cv2.VideoWriter_fourcc(*"mp4v"), fps, (ancho, alto))
+    rng = np.random.default_rng(0)
+    posiciones = rng.uniform(0, 1, (4, 2))
+    velocidades = rng.uniform(-0.01, 0.01, (4, 2))
+    total = int(duracion * fps)
+    for n in range(total):
+        frame = np.full((alto, ancho, 3), 90, np.uint8)
+        posiciones = (posiciones + velocidades) % 1.0
+        for x, y in posiciones:
+            cv2.circle(frame, (int(x * ancho), int(y * alto)), alto // 12, (200, 180, 160), -1)
+        if total / 3 <= n < 2 * total / 3:
+            x, y = posiciones[0]
+            x1, y1 = int(x * ancho), int(y * alto)
+            cv2.rectangle(frame, (x1, y1), (x1 + ancho // 25, y1 + alto // 40), (0, 0, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+    # Audio con modulación de amplitud (sílabas) para que Whisper/ffmpeg tengan trabajo real
+    try:
+        subprocess.run([
+            "ffmpeg", "-i", sin_audio,
+            "-f", "lavfi", "-i", f"aevalsrc=0.4*sin(2*PI*220*t)*(0.5+0.5*sin(2*PI*3*t)):s=16000:d={duracion}",
+            "-c:v", "copy", "-c:a", "aac", "-shortest", "-y", ruta
+        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        os.remove(sin_audio)
+    except Exception as e:
+        print(f"ffmpeg no disponible, clip sin audio: {e}", file=sys.stderr)
+        shutil.move(sin_audio, ruta)
+    return ruta
+
+
+class _Tensor:
+    def __init__(self, valor):
+        self.valor = np.asarray(valor, dtype=np.float32)
+
+    def item(self):
+        return float(self.valor.reshape(-1)[0])
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.valor
+
+    def __getitem__(self, i):
+        return _Tensor(self.valor[i])
+
+
+class _Caja:
+    def __init__(self, xyxy, conf, track_id):
+        self.xyxy = _Tensor([xyxy])
+        self.conf = _Tensor([conf])
+        self.id = _Tensor([track_id])
+
+
+class _Resultado:
+    def __init__(self, cajas):
+        self.boxes = cajas
+
+
+class YoloStub:
+    """Detecta el rectángulo rojo del clip sintético; `latencia` simula el costo de la inferencia"""
+
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+
+    def track(self, frame, **kwargs):
+        if self.latencia:
+            time.sleep(self.latencia)
+        mascara = (frame[:, :, 2] > 200) & (frame[:, :, 1] < 60) & (frame[:, :, 0] < 60)
+        ys, xs = np.nonzero(mascara)
+        if len(xs) == 0:
+            return [_Resultado([])]
+        return [_Resultado([_Caja([xs.min(), ys.min(), xs.max(), ys.max()], 0.9, 1)])]
+
+    def predict(self, frame, **kwargs):
+        return self.track(frame, **kwargs)
+
+
+class WhisperStub:
+    def transcribe(self, audio_path, **kwargs):
+        segmento = type("Segmento", (), {"text": "dame el celular"})()
+        return iter([segmento]), None
+
+
+def blip_stub(imagen, **kwargs):
+    return [{"generated_text": "a person holding a gun on a bus"}]
+
+
+def descripcion_stub(analisis_visual, transcripcion_audio, frame_captions):
+    return "Descripción generada por el stub del benchmark."
+
+
+def rss_pico_mb():
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 1024 / 1024 if sys.platform == "darwin" else pico / 1024
+
+
+def diferencia_etapas(antes, despues):
+    """Segundos por etapa de utils.metricas entre dos instantáneas"""
+    etapas = {}
+    for clave, (suma, conteo) in despues.items():
+        suma_antes, conteo_antes = antes.get(clave, (0.0, 0))
+        if conteo > conteo_antes:
+            etapas[clave[0]] = round(suma - suma_antes, 4)
+    return etapas
+
+
+def medir_clip(ruta, usuario, modelo, stub, modulos):
+    procesar_video, subir_video_b2, procesar_audio, ETAPA_SEGUNDOS = modulos
+    resultado = {}
+
+    # 1. Análisis de video
+    antes = ETAPA_SEGUNDOS.totales()
+    inicio = time.perf_counter()
+    resultados, video_procesado = procesar_video(ruta, usuario, modelo)
+    resultado["procesar_video_s"] = round(time.perf_counter() - inicio, 4)
+    if not video_procesado or "error" in resultados:
+        raise RuntimeError(f"procesar_video falló para {ruta}: {resultados.get('error')}")
+    metricas = resultados.get("metricas", {})
+    resultado["frames"] = metricas.get("frames", 0)
+    resultado["inferencias"] = metricas.get("inferencias", 0)
+    resultado["fps"] = round(resultado["frames"] / resultado["procesar_video_s"], 2)
+    resultado["incidentes"] = len(resultados.get("alertas", []))
+    salidas = [video_procesado, *resultados.get("sidecar", {}).values(), *resultados.get("key_frames", [])]
+    resultado["bytes_escritos"] = sum(os.path.getsize(p) for p in salidas if os.path.exists(p))
+
+    # 2. Subida a B2 (servidor local)
+    recibidos = stub.estadisticas()["bytes_recibidos"]
+    inicio = time.perf_counter()
+    b2_path = f"bench/{os.path.basename(video_procesado)}"
+    if not subir_video_b2(video_procesado, b2_path, "stub", "stub", "stub"):
+        raise RuntimeError("La subida al stub de B2 falló")
+    resultado["subida_b2_s"] = round(time.perf_counter() - inicio, 4)
+    resultado["bytes_b2"] = stub.estadisticas()["bytes_recibidos"] - recibidos
+    resultado["subida_b2_mb_s"] = round(resultado["bytes_b2"] / 1024 / 1024 / resultado["subida_b2_s"], 2)
+
+    # 3. Audio, descripción, MongoDB y UPC
+    inicio = time.perf_counter()
+    procesar_audio(ruta, resultados, usuario, os.path.basename(ruta), b2_path)
+    resultado["procesar_audio_s"] = round(time.perf_counter() - inicio, 4)
+
+    resultado["etapas"] = diferencia_etapas(antes, ETAPA_SEGUNDOS.totales())
+    resultado["rss_pico_mb"] = round(rss_pico_mb(), 1)
+
+    for p in salidas:
+        if os.path.exists(p):
+            os.remove(p)
+    return resultado
+
+
+def comparar(actual, base, tolerancia):
+    """Lista de regresiones: métricas que empeoraron más que `tolerancia` respecto de la base"""
+    previos = {c["clip"]: c for c in base.get("clips", [])}
+    regresiones = []
+    for clip in actual["clips"]:
+        previo = previos.get(clip["clip"])
+        if previo is None:
+            continue
+        for metrica in METRICAS_COMPARABLES:
+            if metrica in previo and previo[metrica] > 0 and clip[metrica] > previo[metrica] * (1 + tolerancia):
+                regresiones.append(f"{clip['clip']} {metrica}: {previo[metrica]} -> {clip[metrica]}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resoluciones", nargs="+", default=["640x360", "1280x720"])
+    parser.add_argument("--duraciones", nargs="+", type=float, default=[10, 25])
+    parser.add_argument("--fps", type=int, default=15)
+    parser.add_argument("--latencia-modelo", type=float, default=0.02, help="Segundos por inferencia del stub YOLO")
+    parser.add_argument("--modelo-real", action="store_true", help="Usar el modelo de armas configurado")
+    parser.add_argument("--mongo", help="URI de un MongoDB real (por defecto, en memoria)")
+    parser.add_argument("--retardo-red", type=float, default=0.0, help="Segundos por petición a los stubs")
+    parser.add_argument("--salida", default="benchmark_pipeline.json")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # Los módulos leen B2_API_URL, KUNTUR_API_URL y MONGO_LOCAL_URI al importarse
+    stub = ServidorStub(retardo=args.retardo_red).iniciar()
+    os.environ["B2_API_URL"] = stub.url
+    os.environ["KUNTUR_API_URL"] = stub.url
+    if args.mongo:
+        os.environ["MONGO_LOCAL_URI"] = args.mongo
+
+    from utils import audio_utils
+    from utils.backblaze_utils import subir_video_b2
+    from utils.metricas import ETAPA_SEGUNDOS
+    from utils.video_processing import MODEL_ARMAS, cargar_modelo_seguro, procesar_video
+
+    if not args.modelo_real:
+        audio_utils.whisper_model = WhisperStub()
+        audio_utils.blip_pipe = blip_stub
+        audio_utils.generar_descripcion_enriquecida = descripcion_stub
+    audio_utils.get_public_ip = lambda: None
+    if not args.mongo:
+        audio_utils.MongoClient = ClienteMongoMemoria
+    modulos = (procesar_video, subir_video_b2, audio_utils.procesar_audio, ETAPA_SEGUNDOS)
+
+    salida = os.path.abspath(args.salida)
+    modelo_real = os.path.abspath(MODEL_ARMAS)
+    directorio = tempfile.mkdtemp(prefix="kuntur_bench_")
+    original = os.getcwd()
+    os.chdir(directorio)  # procesar_video escribe sus salidas en el directorio actual
+
+    clips = []
+    try:
+        for resolucion in args.resoluciones:
+            ancho, alto = map(int, resolucion.lower().split("x"))
+            for duracion in args.duraciones:
+                nombre = f"{resolucion}_{duracion:g}s"
+                ruta = generar_clip(os.path.join(directorio, f"bench@{nombre}.mp4"), ancho, alto, duracion, args.fps)
+                modelo = cargar_modelo_seguro(modelo_real) if args.modelo_real else YoloStub(args.latencia_modelo)
+                resultado = {"clip": nombre, "tamano_clip": os.path.getsize(ruta),
+                             **medir_clip(ruta, "bench", modelo, stub, modulos)}
+                clips.append(resultado)
+                os.remove(ruta)
+                print(f"{nombre:>16}: video {resultado['procesar_video_s']:7.2f}s ({resultado['fps']:6.1f} fps)  "
+                      f"B2 {resultado['subida_b2_s']:6.2f}s  audio {resultado['procesar_audio_s']:6.2f}s  "
+                      f"RSS {resultado['rss_pico_mb']:7.1f} MB")
+    finally:
+        os.chdir(original)
+        shutil.rmtree(directorio, ignore_errors=True)
+        stub.detener()
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True).stdout.strip()
+    except Exception:
+        commit = ""
+    reporte = {
+        "fecha": datetime.now().isoformat(),
+        "commit": commit,
+        "configuracion": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar")},
+        "clips": clips
+    }
+    with open(salida, "w") as f:
+        json.dump(reporte, f, indent=2)
+    print(f"Resultados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            regresiones = comparar(reporte, json.load(f), args.tolerancia)
+        for regresion in regresiones:
+            print(f"REGRESIÓN {regresion}")
+        if regresiones:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Servidores locales que reemplazan a B2, la UPC y el API de Kuntur en los benchmarks,
+y un cliente MongoDB en memoria para cuando no hay un mongod local.
+Uso independiente (p. ej. para levantar main.py contra los stubs):
+    python -m benchmarks.servidores_stub --puerto 9000 --retardo 0.05
+    B2_API_URL=http://localhost:9000 UPC_ENDPOINT=http://localhost:9000/alertas uvicorn main:app
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from bson import ObjectId
+
+
+class ManejadorStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, codigo, cuerpo, tipo="application/json"):
+        if not isinstance(cuerpo, bytes):
+            cuerpo = json.dumps(cuerpo).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _leer_cuerpo(self):
+        largo = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(largo) if largo else b""
+
+    def _registrar(self, ruta, recibidos=0):
+        stub = self.server.stub
+        with stub.lock:
+            stub.peticiones[ruta] += 1
+            stub.bytes_recibidos += recibidos
+        if stub.retardo:
+            time.sleep(stub.retardo)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self._registrar(url.path)
+        stub = self.server.stub
+
+        if url.path == "/b2api/v2/b2_authorize_account":
+            self._responder(200, {
+                "apiUrl": stub.url,
+                "downloadUrl": stub.url,
+                "authorizationToken": "stub"
+            })
+        elif url.path == "/b2api/v2/b2_download_file_by_id":
+            file_id = parse_qs(url.query).get("fileId", [""])[0]
+            datos = stub.archivos.get(file_id)
+            if datos is None:
+                self._responder(404, {"status": 404, "code": "not_found"})
+            else:
+                self._responder(200, datos, "application/octet-stream")
+        else:
+            self._responder(404, {"error": "ruta desconocida"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        cuerpo = self._leer_cuerpo()
+        self._registrar(url.path, len(cuerpo))
+        stub = self.server.stub
+
+        if url.path == "/b2api/v2/b2_get_upload_url":
+            self._responder(200, {"uploadUrl": f"{stub.url}/b2_upload", "authorizationToken": "stub"})
+        elif url.path == "/b2_upload":
+            file_id = uuid.uuid4().hex
+            if stub.guardar_archivos:
+                with stub.lock:
+                    stub.archivos[file_id] = cuerpo
+            self._responder(200, {"fileId": file_id, "fileName": self.headers.get("X-Bz-File-Name")})
+        elif url.path in ("/alertas", "/enviar-evidencia-upc", "/eventos"):
+            # UPC y los endpoints de main.py que llama el procesador
+            self._responder(200, {"status": "success"})
+        else:
+            self._responder(404, {"error": "ruta desconocida"})
+
+
+class ServidorStub:
+    """B2 (autorización, subida, descarga), UPC (/alertas) y los POST del procesador a main.py"""
+
+    def __init__(self, puerto=0, retardo=0.0, guardar_archivos=True):
+        self.retardo = retardo
+        self.guardar_archivos = guardar_archivos
+        self.lock = threading.Lock()
+        self.peticiones = Counter()
+        self.bytes_recibidos = 0
+        self.archivos = {}
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", puerto), ManejadorStub)
+        self.servidor.daemon_threads = True
+        self.servidor.stub = self
+        self.url = f"http://127.0.0.1:{self.servidor.server_address[1]}"
+
+    def iniciar(self):
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        return self
+
+    def detener(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def estadisticas(self):
+        with self.lock:
+            return {"peticiones": dict(self.peticiones), "bytes_recibidos": self.bytes_recibidos}
+
+
+class ColeccionMemoria:
+    def __init__(self):
+        self.documentos = []
+
+    def insert_one(self, documento):
+        documento.setdefault("_id", ObjectId())
+        self.documentos.append(dict(documento))
+        return type("Resultado", (), {"inserted_id": documento["_id"]})()
+
+    def update_one(self, filtro, cambios):
+        modificados = 0
+        for documento in self.documentos:
+            if all(documento.get(k) == v for k, v in filtro.items()):
+                documento.update(cambios.get("$set", {}))
+                modificados = 1
+                break
+        return type("Resultado", (), {"modified_count": modificados})()
+
+    def find(self, filtro=None, proyeccion=None):
+        return [d for d in self.documentos if all(d.get(k) == v for k, v in (filtro or {}).items())]
+
+    def find_one(self, filtro=None, proyeccion=None):
+        encontrados = self.find(filtro)
+        return encontrados[0] if encontrados else None
+
+
+class ClienteMongoMemoria:
+    """Lo justo de MongoClient para audio_utils (insert/update/find); compartido entre instancias"""
+
+    bases = {}
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getitem__(self, nombre_db):
+        return _BaseMemoria(self.bases.setdefault(nombre_db, {}))
+
+    def close(self):
+        pass
+
+
+class _BaseMemoria:
+    def __init__(self, colecciones):
+        self.colecciones = colecciones
+
+    def __getitem__(self, nombre):
+        return self.colecciones.setdefault(nombre, ColeccionMemoria())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--puerto", type=int, default=9000)
+    parser.add_argument("--retardo", type=float, default=0.0, help="Segundos de espera por petición")
+    args = parser.parse_args()
+
+    # Sin guardar los videos subidos: en pruebas de carga solo interesan los conteos
+    stub = ServidorStub(args.puerto, args.retardo, guardar_archivos=False).iniciar()
+    print(f"Stubs B2/UPC en {stub.url} (Ctrl+C para terminar)")
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps(stub.estadisticas()))
+    except KeyboardInterrupt:
+        stub.detener()
+
+
+if __name__ == "__main__":
+    main()
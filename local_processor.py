@@ -35,37 +35,269 @@ B2_BUCKET_ID = os.getenv("B2_BUCKET_ID", "3e5dfb167e65e0af93720710")
 CARPETA_VIDEOS = "./data/videos"
 CARPETA_PROCESADOS = "./data/procesados"
 
+# Retención local (edad en segundos, tamaños en GB; 0 = sin límite)
+RETENCION_INTERVALO = float(os.getenv("RETENCION_INTERVALO", 600))
+RETENCION_VIDEOS_EDAD = float(os.getenv("RETENCION_VIDEOS_EDAD", 3600))
+RETENCION_VIDEOS_GB = float(os.getenv("RETENCION_VIDEOS_GB", 5))
+RETENCION_PROCESADOS_EDAD = float(os.getenv("RETENCION_PROCESADOS_EDAD", 7 * 24 * 3600))
+RETENCION_PROCESADOS_GB = float(os.getenv("RETENCION_PROCESADOS_GB", 50))
+RETENCION_USUARIO_GB = float(os.getenv("RETENCION_USUARIO_GB", 10))
+
 # Importar utilidades
 from utils.video_processing import procesar_video
 from utils.backblaze_utils import subir_video_b2
-from utils.audio_utils import procesar_audio
+from utils.audio_utils import procesar_audio, actualizar_evidencia, evidencia_solapada, modelo_whisper, modelo_blip
 from utils.db_utils import get_user_data
+from utils.eventos import notificar_evento
+from utils.prioridad import ColaPrioridad
+from utils.incidentes import LineaTiempo, ventanas_evidencia
+from utils.ffmpeg_utils import recortar_clip
+from utils.sesiones_camara import RegistroSesiones, SesionCamara
+from utils.ingesta_stream import MARCA_VIVO, es_clip_vivo
+from utils.geo import ubicacion_de_archivo
+from utils.cache_resultados import registrar_clip, procesar_con_huella, guardar_resultado, purgar_cache
+from utils.retencion import GB, GestorRetencion, Regla
+from utils.cola_trabajos import (MODO_COLA, WORKER_ID, Latido, reclamar_trabajo, completar_trabajo,
+                                 fallar_trabajo, obtener_clip, contar_pendientes, nombres_activos)
+from utils.metricas import (CLIPS, COLA, ETAPA_SEGUNDOS, medir, trace_actual, trace_de_archivo,
+                            iniciar_servidor_metricas)
+
+
+# Videos pendientes de procesar (las cámaras en pánico se atienden primero)
+cola_videos = ColaPrioridad()
+
+# Estado por cámara entre segmentos consecutivos (tracker e incidente abierto)
+sesiones = RegistroSesiones()
+
+# Índice de archivos locales con cuotas por directorio y por usuario
+retencion = GestorRetencion({
+    CARPETA_VIDEOS: Regla(RETENCION_VIDEOS_EDAD, RETENCION_VIDEOS_GB * GB),
+    CARPETA_PROCESADOS: Regla(RETENCION_PROCESADOS_EDAD, RETENCION_PROCESADOS_GB * GB, RETENCION_USUARIO_GB * GB)
+})
+
+
+def extraer_usuario(video_path):
+    """Extraer username del filename: usuario@timestamp.mp4"""
+    nombre_base = os.path.basename(video_path).rsplit('.', 1)[0]
+    return nombre_base.split("@")[0] if "@" in nombre_base else "unknown"
 
 
 class VideoHandler(FileSystemEventHandler):
     def on_created(self, event):
         if not event.is_directory and event.src_path.lower().endswith(('.mp4', '.avi', '.mov', '.webm')):
             logger.info(f"\nNuevo video detectado: {event.src_path}")
-            try:
-                time.sleep(2)  # Esperar a que el archivo esté completamente escrito
-                procesar_video_local(event.src_path)
-            except Exception as e:
-                logger.error(f"Error procesando video: {str(e)}")
-                logger.error(traceback.format_exc())
+            retencion.registrar(event.src_path)
+            retencion.marcar_en_uso(event.src_path)
+            cola_videos.put(extraer_usuario(event.src_path), event.src_path)
+            CLIPS.inc(evento="detectado")
+            COLA.set(len(cola_videos), cola="local")
+
+
+def procesar_cola():
+    """Procesa los videos encolados en orden de prioridad"""
+    while True:
+        usuario, video_path = cola_videos.get()
+        COLA.set(len(cola_videos), cola="local")
+        try:
+            # Esperar a que el archivo esté completamente escrito
+            time.sleep(max(0, 2 - (time.time() - os.path.getmtime(video_path))))
+            ETAPA_SEGUNDOS.observe(time.time() - os.path.getmtime(video_path), etapa="espera_cola")
+            procesar_video_local(video_path)
+        except Exception as e:
+            logger.error(f"Error procesando video: {str(e)}")
+            logger.error(traceback.format_exc())
+        finally:
+            retencion.liberar(video_path)
+
+
+def procesar_trabajos():
+    """Toma clips de la cola compartida en MongoDB (MODO_COLA=mongo)"""
+    logger.info(f"Nodo procesador {WORKER_ID} esperando trabajos...")
+    while True:
+        try:
+            trabajo = reclamar_trabajo()
+        except Exception as e:
+            logger.error(f"Error reclamando trabajo: {str(e)}")
+            time.sleep(10)
+            continue
+
+        if trabajo is None:
+            COLA.set(0, cola="mongo")
+            time.sleep(2)
+            continue
+
+        logger.info(f"Trabajo {trabajo['_id']} reclamado: {trabajo['ruta']} (intento {trabajo['intentos']})")
+        ETAPA_SEGUNDOS.observe(time.time() - trabajo["creado"], etapa="espera_cola")
+        try:
+            COLA.set(contar_pendientes(), cola="mongo")
+        except Exception as e:
+            logger.error(f"Error contando trabajos pendientes: {str(e)}")
+        try:
+            with Latido(trabajo["_id"]):
+                video_path = obtener_clip(trabajo, B2_KEY_ID, B2_APP_KEY)
+                retencion.registrar(video_path)
+                retencion.marcar_en_uso(video_path)
+                try:
+                    resuelto = procesar_video_local(video_path)
+                finally:
+                    retencion.liberar(video_path)
+            if resuelto:
+                completar_trabajo(trabajo["_id"])
+            else:
+                # Vuelve a la cola (o queda fallido tras TRABAJOS_MAX_INTENTOS)
+                logger.error(f"Trabajo {trabajo['_id']} sin resultado guardado")
+                fallar_trabajo(trabajo, "Procesamiento sin resultado guardado")
+        except Exception as e:
+            logger.error(f"Error procesando trabajo {trabajo['_id']}: {str(e)}")
+            logger.error(traceback.format_exc())
+            fallar_trabajo(trabajo, e)
+
+
+def subir_a_b2(ruta, b2_path):
+    try:
+        logger.info(f"Subiendo video a Backblaze: {b2_path}")
+        subido = subir_video_b2(ruta, b2_path, B2_KEY_ID, B2_APP_KEY, B2_BUCKET_ID)
+        if subido:
+            logger.info(f"¡Video subido a Backblaze como {b2_path}!")
+        else:
+            logger.error("Error al subir video a Backblaze")
+        return bool(subido)
+    except Exception as e:
+        logger.error(f"Error subiendo a Backblaze: {str(e)}")
+        return False
+
+
+def subir_sidecars(sidecars, carpeta_b2, nombre):
+    """Sube los sidecars JSON/WebVTT de un clip; devuelve {formato: b2_path}"""
+    subidos = {}
+    for formato, ruta_sidecar in sidecars.items():
+        b2_sidecar = f"{carpeta_b2}/{nombre}.{formato}"
+        try:
+            if subir_video_b2(ruta_sidecar, b2_sidecar, B2_KEY_ID, B2_APP_KEY, B2_BUCKET_ID):
+                subidos[formato] = b2_sidecar
+        except Exception as e:
+            logger.error(f"Error subiendo sidecar a Backblaze: {str(e)}")
+    return subidos
+
+
+def sidecars_de_clip(sidecars, inicio, fin, base):
+    """Sidecars del clip [inicio, fin] con los tiempos relativos al comienzo del clip"""
+    if "json" not in sidecars:
+        return {}
+    try:
+        linea, ancho, alto = LineaTiempo.cargar_json(sidecars["json"])
+    except Exception as e:
+        logger.error(f"Error leyendo sidecar {sidecars['json']}: {str(e)}")
+        return {}
+    recorte = linea.recortar(inicio, fin)
+    return {
+        "json": recorte.guardar_json(f"{base}.json", ancho, alto),
+        "vtt": recorte.guardar_webvtt(f"{base}.vtt")
+    }
+
+
+def subir_ventanas(video_procesado, resultados, carpeta_b2, hora_actual):
+    """
+    Recorta el video a las ventanas pre/post-roll de los incidentes y sube solo
+    esos clips, cada uno con sus sidecars. Si las ventanas cubren casi todo el
+    segmento se sube completo.
+    """
+    duracion = resultados.get("duracion", 0)
+    ventanas = ventanas_evidencia(resultados.get("alertas", []), duracion)
+    extension = os.path.splitext(video_procesado)[1] or ".mp4"
+    sidecars = resultados.get("sidecar", {})
+
+    clips = []
+    if duracion > 0 and sum(fin - inicio for inicio, fin in ventanas) < duracion * 0.9:
+        for n, (inicio, fin) in enumerate(ventanas):
+            ruta_clip = f"clip{n + 1}_{os.path.splitext(os.path.basename(video_procesado))[0]}.mp4"
+            # El corte sin recodificar puede empezar antes (keyframe): las ventanas usan el inicio real
+            inicio_real = recortar_clip(video_procesado, ruta_clip, inicio, fin)
+            if inicio_real is None:
+                # Sin esa ventana el incidente quedaría sin video: se sube el segmento completo
+                logger.error(f"No se pudo recortar la ventana {inicio:.1f}-{fin:.1f}s, se sube el segmento completo")
+                for _, _, ruta in clips:
+                    os.remove(ruta)
+                clips = []
+                break
+            clips.append((inicio_real, fin, ruta_clip))
+    if not clips:
+        clips = [(0.0, duracion, video_procesado)]
+
+    subidas = []
+    for n, (inicio, fin, ruta_clip) in enumerate(clips):
+        if ruta_clip == video_procesado:
+            nombre, extension_clip, sidecars_clip = hora_actual, extension, sidecars
+        else:
+            nombre, extension_clip = f"{hora_actual}_{n + 1}", ".mp4"
+            sidecars_clip = sidecars_de_clip(sidecars, inicio, fin, os.path.splitext(ruta_clip)[0])
+        b2_path = f"{carpeta_b2}/{nombre}{extension_clip}"
+        subidas.append({
+            "inicio": inicio,
+            "fin": fin,
+            "b2_path": b2_path,
+            "tamano": os.path.getsize(ruta_clip),
+            "subido": subir_a_b2(ruta_clip, b2_path),
+            "completo": ruta_clip == video_procesado,  # El segmento entero, no una ventana recortada
+            "sidecar_b2": subir_sidecars(sidecars_clip, carpeta_b2, nombre)
+        })
+        if ruta_clip != video_procesado:
+            os.remove(ruta_clip)
+            for ruta_sidecar in sidecars_clip.values():
+                os.remove(ruta_sidecar)
+    return subidas
 
 
 def procesar_video_local(video_path):
-    # Procesar video
-    resultados, video_procesado = procesar_video(video_path)
+    """True si el clip quedó resuelto (procesado o duplicado); False si hay que reintentarlo"""
+    # Mismo trace que devolvió /upload-video: se deriva del nombre del archivo
+    trace_actual.set(trace_de_archivo(video_path))
+    with medir("clip_total"):
+        resuelto = _procesar_video_local(video_path)
+    CLIPS.inc(evento="procesado" if resuelto else "fallido")
+    return resuelto
 
-    if not resultados or "error" in resultados:
-        logger.error("Error en procesamiento de video")
-        return
 
-    # Extraer username del filename: usuario@timestamp.mp4
+def _procesar_video_local(video_path):
+    # Saltar reenvíos del mismo contenido
+    with medir("huella"):
+        huella, previo = registrar_clip(video_path)
+    if previo is not None:
+        logger.info(f"Video duplicado de {previo['ruta']} (b2: {previo['b2_path']}), se omite")
+        CLIPS.inc(evento="duplicado")
+        os.remove(video_path)
+        retencion.olvidar(video_path)
+        return True
+
+    # Si el análisis no llega a guardar su resultado, la huella se libera para reintentar
+    return procesar_con_huella(huella, analizar_clip, video_path, huella)
+
+
+def analizar_clip(video_path, huella):
+    """Analiza, sube y archiva un clip. True si su resultado quedó guardado en la cache"""
     video_filename = os.path.basename(video_path)
-    nombre_base = video_filename.rsplit('.', 1)[0]
-    username = nombre_base.split("@")[0] if "@" in nombre_base else "unknown"
+    username = extraer_usuario(video_path)
+    vivo = es_clip_vivo(video_path)
+    # Los clips en vivo se solapan con los segmentos: sesión propia para no pasar por el
+    # tracker ni la continuidad de los segmentos de la cámara
+    sesion = SesionCamara(username) if vivo else sesiones.obtener(username)
+
+    # Procesar video con el modelo (y tracker) de la sesión de la cámara
+    try:
+        modelo = sesion.modelo_armas()
+    except Exception as e:
+        logger.error(f"Error cargando modelo de la sesión: {str(e)}")
+        modelo = None
+    camara = f"{username}@{MARCA_VIVO}" if vivo else username
+    resultados, video_procesado = procesar_video(video_path, camara, modelo)
+    if resultados is not None:
+        resultados["trace_id"] = trace_actual.get()
+        # Posición donde se grabó el segmento (la evidencia se ubica ahí, no donde está la cámara ahora)
+        resultados["ubicacion"] = ubicacion_de_archivo(video_path)
+
+    if not resultados or "error" in resultados:
+        logger.error("Error en procesamiento de video")
+        return False
 
     # Obtener datos de usuario desde la base de datos
     user_data = get_user_data(username) or {}
@@ -80,68 +312,125 @@ def procesar_video_local(video_path):
 
     # Manejar videos con alertas
     if resultados.get("alertas"):
+        continua = sesion.es_continuacion(resultados)
+        if continua:
+            logger.info(f"Segmento continúa el incidente abierto de {username}")
+
+        # Hora real de los incidentes: el clip en vivo y el segmento del mismo momento comparten evidencia
+        inicio_segmento = resultados["inicio_segmento"]
+        incidentes = [(inicio_segmento + a["inicio"], inicio_segmento + a["fin"]) for a in resultados["alertas"]]
+        resultados["intervalo"] = {"desde": min(d for d, _ in incidentes), "hasta": max(h for _, h in incidentes)}
+        id_existente = sesion.id_evidencia if continua else evidencia_solapada(username, incidentes)
+        if id_existente and not continua:
+            logger.info(f"{video_filename} cubre incidentes ya registrados en la evidencia {id_existente}")
+
+        # La detección en vivo ya se avisó desde main.py; un incidente ya registrado tampoco se repite
+        if not vivo and not id_existente:
+            notificar_evento("deteccion", {
+                "usuario": username,
+                "unidad": unidad,
+                "video": video_filename,
+                "alertas": len(resultados["alertas"]),
+                "escalada": resultados.get("alerta_activa", False),
+                "continua": continua,
+                "confianza": max(a["confianza"] for a in resultados["alertas"]),
+                "trace_id": resultados["trace_id"]
+            }, [username, unidad])
+
         # Crear nombre estructurado
-        nombre_evidencia = f"{hora_actual}.mp4"
-        b2_path = f"{username}/{unidad}/{fecha_actual}/{nombre_evidencia}"
+        extension = os.path.splitext(video_procesado)[1] or ".mp4"
+        nombre_evidencia = f"{hora_actual}{os.path.splitext(video_path)[1] or '.mp4'}"
+        sidecars = resultados.get("sidecar", {})
 
-        # Subir a Backblaze
-        try:
-            logger.info(f"Subiendo video a Backblaze: {b2_path}")
-            subido = subir_video_b2(
-                video_procesado,
-                b2_path,
-                B2_KEY_ID,
-                B2_APP_KEY,
-                B2_BUCKET_ID
-            )
-            if subido:
-                logger.info(f"¡Video subido a Backblaze como {b2_path}!")
-            else:
-                logger.error("Error al subir video a Backblaze")
-        except Exception as e:
-            logger.error(f"Error subiendo a Backblaze: {str(e)}")
+        # Subir a Backblaze solo las ventanas alrededor de los incidentes
+        carpeta_b2 = f"{username}/{unidad}/{fecha_actual}"
+        resultados["ventanas"] = subir_ventanas(video_procesado, resultados, carpeta_b2, hora_actual)
+        b2_path = resultados["ventanas"][0]["b2_path"]
+
+        # Detecciones (sidecar JSON/WebVTT) del clip principal, en el tiempo de ese clip
+        resultados["sidecar_b2"] = resultados["ventanas"][0]["sidecar_b2"]
 
         # Mover archivos a carpeta estructurada
         try:
-            # Mover video procesado
-            destino_procesado = os.path.join(estructura_carpeta, f"{hora_actual}_procesado.mp4")
+            # Mover video procesado y sidecars
+            destino_procesado = os.path.join(estructura_carpeta, f"{hora_actual}_procesado{extension}")
             shutil.move(video_procesado, destino_procesado)
+            # Solo hay copia en B2 del segmento entero si se subió sin recortar
+            completo_en_b2 = any(v["completo"] and v["subido"] for v in resultados["ventanas"])
+            retencion.registrar(destino_procesado, en_b2=completo_en_b2)
+            for formato, ruta_sidecar in sidecars.items():
+                destino_sidecar = os.path.join(estructura_carpeta, f"{hora_actual}.{formato}")
+                shutil.move(ruta_sidecar, destino_sidecar)
+                retencion.registrar(destino_sidecar, en_b2=formato in resultados["sidecar_b2"])
 
             # Mover video original
             destino_original = os.path.join(estructura_carpeta, nombre_evidencia)
             shutil.move(video_path, destino_original)
+            retencion.olvidar(video_path)
+            retencion.registrar(destino_original)
             logger.info(f"Archivos movidos a: {estructura_carpeta}")
 
-            # Procesar audio y generar JSON final
-            procesar_audio(destino_original, resultados, username, nombre_evidencia, b2_path)
+            if id_existente:
+                # Mismo incidente que el segmento anterior o que un clip ya procesado: se amplía
+                # su evidencia sin repetir BLIP/Whisper/LLM ni la notificación a la UPC
+                actualizar_evidencia(id_existente, resultados)
+                notificar_evento("evidencia_actualizada", {
+                    "id_evidencia": id_existente,
+                    "usuario": username,
+                    "ventanas": len(resultados["ventanas"])
+                }, [username])
+                for frame_path in resultados.get("key_frames", []):
+                    os.remove(frame_path)
+                id_evidencia = id_existente
+            else:
+                # Procesar audio y generar JSON final
+                evidencia = procesar_audio(destino_original, resultados, username, nombre_evidencia, b2_path)
+                id_evidencia = str(evidencia["_id"]) if evidencia and "_id" in evidencia else None
+            sesion.cerrar_segmento(resultados, id_evidencia)
+            return guardar_resultado(huella, {
+                "alertas": resultados["alertas"],
+                "ventanas": resultados["ventanas"],
+                "duracion": resultados.get("duracion"),
+                "id_evidencia": id_evidencia,
+                "trace_id": resultados["trace_id"]
+            }, b2_path)
         except Exception as e:
             logger.error(f"Error moviendo archivos: {str(e)}")
+            sesion.cerrar_segmento(resultados)
+            return False
     else:
+        sesion.cerrar_segmento(resultados)
+        guardado = guardar_resultado(huella, {"alertas": [], "duracion": resultados.get("duracion"),
+                                              "trace_id": resultados["trace_id"]})
+
         # Eliminar videos sin alertas
         try:
             os.remove(video_path)
+            retencion.olvidar(video_path)
             os.remove(video_procesado)
+            for ruta_sidecar in resultados.get("sidecar", {}).values():
+                os.remove(ruta_sidecar)
             logger.info("Videos sin alertas eliminados")
         except Exception as e:
             logger.error(f"Error eliminando videos: {str(e)}")
+        return guardado
 
 
-# Nueva función de limpieza automática
+# Limpieza automática por índice (sin recorrer las carpetas)
 def limpieza_automatica():
+    retencion.indexar_inicial()
     while True:
         logger.info("Ejecutando limpieza automática...")
         try:
-            # Limpiar solo carpeta de videos (los procesados se mantienen)
-            for filename in os.listdir(CARPETA_VIDEOS):
-                file_path = os.path.join(CARPETA_VIDEOS, filename)
-                if os.path.isfile(file_path):
-                    file_age = time.time() - os.path.getmtime(file_path)
-                    if file_age > 600:  # 10 minutos
-                        os.remove(file_path)
-                        logger.info(f"Borrado: {file_path}")
+            if MODO_COLA == "mongo":
+                # Clips que otro nodo todavía va a procesar (o está procesando) no se borran
+                retencion.aplicar(protegidos=nombres_activos())
+            else:
+                retencion.aplicar()
+            purgar_cache()
         except Exception as e:
             logger.error(f"Error en limpieza: {str(e)}")
-        time.sleep(600)  # Esperar 10 minutos
+        time.sleep(RETENCION_INTERVALO)
 
 
 if __name__ == "__main__":
@@ -150,10 +439,32 @@ if __name__ == "__main__":
     os.makedirs(CARPETA_PROCESADOS, exist_ok=True)
     os.makedirs(os.path.join("data", "frames"), exist_ok=True)
 
+    # Métricas de este nodo en http://host:PUERTO_METRICAS/metrics
+    try:
+        iniciar_servidor_metricas()
+    except OSError as e:
+        logger.error(f"No se pudo iniciar el servidor de métricas: {str(e)}")
+
+    # Cargar Whisper y BLIP antes del primer clip
+    modelo_whisper()
+    modelo_blip()
+
     # Iniciar hilo de limpieza automática
     cleaner = threading.Thread(target=limpieza_automatica, daemon=True)
     cleaner.start()
 
+    # Cola compartida: los clips llegan por MongoDB en vez de la carpeta local
+    if MODO_COLA == "mongo":
+        try:
+            procesar_trabajos()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    # Iniciar hilo de procesamiento por prioridad
+    worker = threading.Thread(target=procesar_cola, daemon=True)
+    worker.start()
+
     # Iniciar monitorización de nuevos videos
     event_handler = VideoHandler()
     observer = Observer()
@@ -1,14 +1,29 @@
-from fastapi import FastAPI, HTTPException, Request, Form, Depends, status, UploadFile, File
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Request, Form, Depends, status, UploadFile, File, WebSocket, WebSocketDisconnect, BackgroundTasks, Header
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from pymongo import MongoClient
+from bson import ObjectId
 from dotenv import load_dotenv
 import os
 import json
+import time
+import asyncio
 from datetime import datetime
 from utils.db_utils import get_db, User, get_user_data, verify_user, create_user, init_db
+from utils.ingesta_stream import SesionIngesta
+from utils.eventos import (BrokerEventos, flujo_sse, COOKIE_SESION, EVENTOS_SECRETO, firmar_sesion,
+                           secreto_valido, usuario_de_sesion)
+from utils.prioridad import marcar_prioridad
+from utils.alert_system import ventana_alertas
+from utils.cache_resultados import descartar_huella, huella_bytes, registrar_huella
+from utils.cola_trabajos import MODO_COLA, encolar_trabajo, priorizar_usuario, contar_pendientes
+from utils.prioridad import es_prioritario
+from utils.backblaze_utils import subir_video_b2
+from utils.geo import (CacheTTL, GEO_PRECISION, agregar_hotspots, incidentes_cercanos, normalizar_ubicacion,
+                       registrar_ubicacion, sufijo_ubicacion)
+from utils.metricas import registro, medir, trace_actual, trace_de_archivo, CLIPS, COLA, CONEXIONES, ETAPA_SEGUNDOS
 import logging
 import requests
 from typing import Dict, Any
@@ -29,6 +44,8 @@ templates = Jinja2Templates(directory="templates")
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB = os.getenv("MONGO_DB", "kuntur_db")
 MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "alertas")
+MONGO_LOCAL_URI = os.getenv("MONGO_LOCAL_URI", "mongodb://localhost:27017/")  # Kuntur (igual que local_processor.py)
+KUNTUR_DB = os.getenv("KUNTUR_DB", "Kuntur")  # Base de evidencias, alertas y ubicaciones
 
 # Conectar a MongoDB
 try:
@@ -41,14 +58,24 @@ except Exception as e:
     db = None
     collection = None
 
+# Broker de eventos en vivo (SSE) para cámaras y operadores
+broker = BrokerEventos()
+
+# Agregaciones de hotspots recientes (los tableros refrescan seguido)
+cache_hotspots = CacheTTL()
+
+# Tareas lanzadas desde los WebSocket (el event loop solo guarda referencias débiles)
+tareas_fondo = set()
+
 
 # Función auxiliar para guardar en MongoDB (reutilizable)
 def guardar_json_mongodb(db_name: str, collection_name: str, data: Dict[str, Any]):
     try:
-        client = MongoClient("mongodb://localhost:27017/")
+        client = MongoClient(MONGO_LOCAL_URI)
         db = client[db_name]
         collection = db[collection_name]
-        result = collection.insert_one(data)
+        with medir("mongo_insert"):
+            result = collection.insert_one(data)
         return {"inserted_id": str(result.inserted_id)}
     except Exception as e:
         logger.error(f"Error guardando en MongoDB: {e}")
@@ -66,7 +93,10 @@ async def read_login(request: Request):
 @app.post("/", response_class=HTMLResponse)
 async def login(request: Request, usuario: str = Form(...), password: str = Form(...)):
     if verify_user(usuario, password):
-        return RedirectResponse(url=f"/camara?usuario={usuario}", status_code=status.HTTP_302_FOUND)
+        response = RedirectResponse(url=f"/camara?usuario={usuario}", status_code=status.HTTP_302_FOUND)
+        # La sesión firmada limita /eventos al canal del propio usuario
+        response.set_cookie(COOKIE_SESION, firmar_sesion(usuario), httponly=True, samesite="lax")
+        return response
     return templates.TemplateResponse("login.html", {"request": request, "error": "Credenciales inválidas"})
 
 
@@ -103,6 +133,7 @@ async def camara(request: Request, usuario: str):
     return templates.TemplateResponse("camara.html", {
         "request": request,
         "usuario": usuario,
+        "unidad": user_data['unidad'],
         "ip_camara": user_data['ip_camara']
     })
 
@@ -133,19 +164,113 @@ async def enviar_evidencia_upc(evidencia: dict):
 
         # Enviar a UPC
         upc_endpoint = os.getenv("UPC_ENDPOINT", "https://api.upc.edu.pe/alertas")
-        response = requests.post(upc_endpoint, json=evidencia, timeout=10)
-
-        if response.status_code == 200:
+        trace_actual.set(evidencia.get("trace_id", ""))
+        with medir("upc_envio"):
+            response = await asyncio.to_thread(requests.post, upc_endpoint, json=evidencia, timeout=10)
+
+        entregado = response.status_code == 200
+        broker.publicar("upc", {
+            "usuario": evidencia["usuario"],
+            "url_evidencia": evidencia["url_evidencia"],
+            "entregado": entregado,
+            "codigo": response.status_code
+        }, [evidencia["usuario"]])
+
+        if entregado:
             return {"status": "success", "message": "Evidencia enviada a UPC"}
         else:
             logger.error(f"Error UPC: {response.status_code} - {response.text}")
             return {"status": "error", "message": "Error en servidor UPC"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error enviando a UPC: {str(e)}")
+        broker.publicar("upc", {
+            "usuario": evidencia.get("usuario"),
+            "url_evidencia": evidencia.get("url_evidencia"),
+            "entregado": False,
+            "error": str(e)
+        }, [evidencia.get("usuario")])
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def notificar_panico_upc(alerta: Dict[str, Any]):
+    """Envía la alerta de pánico a la UPC sin bloquear la respuesta a la cámara"""
+    upc_endpoint = os.getenv("UPC_ENDPOINT", "https://api.upc.edu.pe/alertas")
+    estado = {"usuario": alerta["usuario"], "tipo": "panico", "entregado": False}
+    try:
+        with medir("upc_panico"):
+            response = await asyncio.to_thread(requests.post, upc_endpoint, json=alerta, timeout=10)
+        estado["entregado"] = response.status_code == 200
+        estado["codigo"] = response.status_code
+        if not estado["entregado"]:
+            logger.error(f"Error UPC (pánico): {response.status_code} - {response.text}")
+    except Exception as e:
+        logger.error(f"Error enviando pánico a UPC: {str(e)}")
+        estado["error"] = str(e)
+    broker.publicar("upc", estado, [alerta["usuario"], alerta.get("unidad")])
+
+
+# Endpoint del botón de pánico (camino rápido, sin análisis de video)
+@app.post("/enviar-alerta")
+async def enviar_alerta(alerta: dict, background_tasks: BackgroundTasks):
+    """
+    Registra una alerta manual y la envía a la UPC de inmediato.
+    Ejemplo de JSON:
+    {
+        "tipo": "panico",
+        "timestamp": 1721305000000,
+        "usuario": "user123",
+        "unidad": "Bus 12",
+        "ubicacion": {"lat": -0.180, "lng": -78.467}
+    }
+    """
+    if not alerta.get("usuario"):
+        raise HTTPException(status_code=400, detail="Falta el campo usuario")
+
+    usuario = alerta["usuario"]
+    alerta.setdefault("tipo", "panico")
+    alerta["fecha"] = datetime.now().isoformat()
+    alerta["estado"] = "nuevo"
+
+    # Los segmentos pendientes y siguientes de esta cámara pasan al frente de la cola
+    marcar_prioridad(usuario)
+    if MODO_COLA == "mongo":
+        try:
+            await asyncio.to_thread(priorizar_usuario, usuario)
+        except Exception as e:
+            logger.error(f"Error priorizando trabajos de {usuario}: {e}")
+
+    # Campos que espera el endpoint de la UPC
+    user_data = get_user_data(usuario) or {}
+    if not alerta.get("unidad"):
+        alerta["unidad"] = user_data.get("unidad", "")
+    alerta["ip_camara"] = user_data.get("ip_camara", "")
+    alerta["descripcion"] = f"Botón de pánico activado en la unidad {alerta['unidad']}"
+
+    # Copia: normalizar_ubicacion e insert_one modifican `alerta` después
+    broker.publicar("panico", dict(alerta), [usuario, alerta["unidad"]])
+    background_tasks.add_task(notificar_panico_upc, dict(alerta))
+
+    # La UPC recibe la ubicación tal como la envió la cámara; en Mongo se guarda como GeoJSON
+    normalizar_ubicacion(alerta)
+    resultado = await asyncio.to_thread(guardar_json_mongodb, KUNTUR_DB, "Alertas", alerta)
+    return {"status": "success", "message": "Alerta registrada", "id": (resultado or {}).get("inserted_id")}
+
+
+def usuario_de_evidencia(id_evidencia: str):
+    """Busca el usuario dueño de una evidencia para dirigir eventos"""
+    try:
+        client = MongoClient(MONGO_LOCAL_URI)
+        evidencia = client[KUNTUR_DB]["Evidencias"].find_one({"_id": ObjectId(id_evidencia)}, {"usuario": 1})
+        client.close()
+        return evidencia.get("usuario") if evidencia else None
+    except Exception as e:
+        logger.error(f"Error buscando evidencia {id_evidencia}: {e}")
+        return None
+
+
 # Endpoint para recibir resoluciones de Justicia
 @app.post("/resoluciones")
 async def recibir_resolucion(resolucion: dict):
@@ -173,59 +298,331 @@ async def recibir_resolucion(resolucion: dict):
         resolucion["fecha_recepcion"] = datetime.now().isoformat()
 
         # Guardar en MongoDB en la colección Resoluciones
-        guardar_json_mongodb("Kuntur", "Resoluciones", resolucion)
+        await asyncio.to_thread(guardar_json_mongodb, KUNTUR_DB, "Resoluciones", resolucion)
+
+        # Avisar al dueño de la evidencia (si se encuentra) y a los operadores
+        resolucion.pop("_id", None)
+        dueno = await asyncio.to_thread(usuario_de_evidencia, resolucion["id_evidencia"])
+        broker.publicar("resolucion", resolucion, [dueno])
         return {"status": "success", "message": "Resolución almacenada"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error procesando resolución: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def guardar_ubicacion(usuario: str, lat: float, lon: float):
+    try:
+        client = MongoClient(MONGO_LOCAL_URI)
+        registrar_ubicacion(client[KUNTUR_DB]["Ubicaciones"], usuario, lat, lon)
+        client.close()
+    except Exception as e:
+        logger.error(f"Error guardando ubicación de {usuario}: {e}")
+
+
 # Endpoint para recibir videos de la cámara
 @app.post("/upload-video")
-async def upload_video(usuario: str, video: UploadFile = File(...)):
-    """Endpoint para recibir videos de la cámara IP"""
+async def upload_video(usuario: str, video: UploadFile = File(...), lat: float = None, lon: float = None):
+    """Endpoint para recibir videos de la cámara IP (lat/lon: posición actual de la cámara, opcional)"""
     try:
-        # Crear carpeta para el usuario si no existe
-        user_folder = os.path.join("data", "videos", usuario)
-        os.makedirs(user_folder, exist_ok=True)
+        # Guardar en la carpeta vigilada por local_processor.py
+        video_folder = os.path.join("data", "videos")
+        os.makedirs(video_folder, exist_ok=True)
+
+        # Generar nombre de archivo con timestamp (usuario@timestamp identifica la cámara);
+        # la posición donde se grabó viaja en el nombre hasta la evidencia
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filename = f"{usuario}@{timestamp}{sufijo_ubicacion(lat, lon)}.mp4"
+        file_path = os.path.join(video_folder, filename)
+
+        # El procesador deriva el mismo trace del nombre del archivo
+        trace_id = trace_de_archivo(filename)
+        trace_actual.set(trace_id)
+
+        # Reintentos del navegador: el mismo contenido no se vuelve a guardar ni procesar
+        contenido = await video.read()
+        huella = huella_bytes(contenido)
+        previo = await asyncio.to_thread(registrar_huella, huella, len(contenido), file_path)
+        if previo is not None:
+            CLIPS.inc(evento="duplicado")
+            return {
+                "mensaje": "Video duplicado",
+                "duplicado": True,
+                "ruta": previo["ruta"],
+                "b2_path": previo["b2_path"]
+            }
+
+        # Última posición de la cámara (respaldo para clips que no traen la suya)
+        if lat is not None and lon is not None:
+            await asyncio.to_thread(guardar_ubicacion, usuario, lat, lon)
+
+        try:
+            # Guardar el video
+            with medir("api_escritura"):
+                with open(file_path, "wb") as f:
+                    f.write(contenido)
+            CLIPS.inc(evento="recibido")
+
+            # Cola compartida: cualquier nodo procesador puede tomar el clip
+            if MODO_COLA == "mongo":
+                b2_file_id = None
+                if os.getenv("SUBIR_CRUDO_B2", "0") == "1":
+                    # Copia en B2 para nodos que no montan la carpeta compartida
+                    subido = await asyncio.to_thread(
+                        subir_video_b2, file_path, f"crudos/{filename}",
+                        os.getenv("B2_KEY_ID"), os.getenv("B2_APP_KEY"), os.getenv("B2_BUCKET_ID")
+                    )
+                    b2_file_id = subido if isinstance(subido, str) else None
+                prioridad = 1 if es_prioritario(usuario) else 0
+                with medir("mongo_encolar"):
+                    id_trabajo = await asyncio.to_thread(encolar_trabajo, file_path, usuario, prioridad, b2_file_id)
+                return {"mensaje": "Video recibido", "ruta": file_path, "trabajo": id_trabajo, "trace_id": trace_id}
+        except Exception:
+            # Sin archivo o sin trabajo nadie lo va a procesar: el reintento del navegador debe entrar
+            await asyncio.to_thread(descartar_huella, huella)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+
+        return {"mensaje": "Video recibido", "ruta": file_path, "trace_id": trace_id}
+    except Exception as e:
+        logger.error(f"Error subiendo video: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error al procesar el video")
+
+
+def lanzar_tarea(corrutina):
+    """create_task que conserva la tarea hasta que termina y registra su excepción"""
+    tarea = asyncio.create_task(corrutina)
+    tareas_fondo.add(tarea)
+    tarea.add_done_callback(_tarea_terminada)
+    return tarea
+
 
-        # Generar nombre de archivo con timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{usuario}_{timestamp}.mp4"
-        file_path = os.path.join(user_folder, filename)
+def _tarea_terminada(tarea):
+    tareas_fondo.discard(tarea)
+    if not tarea.cancelled() and tarea.exception() is not None:
+        logger.error(f"Error en tarea en segundo plano: {tarea.exception()}")
 
-        # Guardar el video
-        with open(file_path, "wb") as f:
-            f.write(await video.read())
 
-        return {"mensaje": "Video recibido", "ruta": file_path}
+async def detectar_y_notificar(sesion: SesionIngesta, datos: bytes, recibido: float):
+    """Ejecuta la detección fuera del event loop y avisa por SSE si hay armas"""
+    try:
+        armas = await asyncio.to_thread(sesion.detectar, datos)
+        ETAPA_SEGUNDOS.observe(time.time() - recibido, etapa="ws_deteccion")
+        if not armas:
+            ventana_alertas.actualizar(sesion.usuario, "armaDetectada", recibido)
+            return
+
+        sesion.programar_clip(recibido)
+        cambio = ventana_alertas.registrar(sesion.usuario, "armaDetectada", recibido)
+        deteccion = {
+            "evento": "armaDetectada",
+            "usuario": sesion.usuario,
+            "confianza": max(a[4] for a in armas),
+            "cajas": [list(a[:4]) for a in armas],
+            "escalada": cambio == "activada" or ventana_alertas.activa(sesion.usuario, "armaDetectada"),
+            "latencia_ms": round((time.time() - recibido) * 1000)
+        }
+        # Un solo camino hacia la cámara: el evento SSE "deteccion" (igual que los segmentos subidos)
+        broker.publicar("deteccion", deteccion, [sesion.usuario])
     except Exception as e:
-        logger.error(f"Error subiendo video: {str(e)}")
-        raise HTTPException(status_code=500, detail="Error al procesar el video")
+        logger.error(f"Error en detección en vivo de {sesion.usuario}: {str(e)}")
 
 
-# Endpoint para listar evidencias (para pruebas)
+# WebSocket para recibir frames JPEG de la cámara en vivo
+@app.websocket("/ws/camara/{usuario}")
+async def ingesta_camara(websocket: WebSocket, usuario: str):
+    """
+    Recibe frames JPEG (mensajes binarios) de la cámara y detecta armas en
+    menos de un segundo. Si el modelo sigue ocupado con un frame anterior,
+    el frame nuevo solo se guarda en el buffer (no se encola la inferencia).
+    """
+    await websocket.accept()
+    sesion = SesionIngesta(usuario)
+    try:
+        await asyncio.to_thread(sesion.cargar_modelo)
+    except Exception as e:
+        logger.error(f"Error cargando modelo para {usuario}: {str(e)}")
+        await websocket.close(code=1011)
+        return
+
+    logger.info(f"Cámara conectada por WebSocket: {usuario}")
+    CONEXIONES.inc(tipo="websocket")
+    deteccion = None
+    try:
+        while True:
+            datos = await websocket.receive_bytes()
+            recibido = time.time()
+
+            if sesion.agregar_frame(datos, recibido) and (deteccion is None or deteccion.done()):
+                deteccion = lanzar_tarea(detectar_y_notificar(sesion, datos, recibido))
+
+            # Cortar el clip de evidencia cuando termina el post-roll
+            if sesion.clip_listo(recibido):
+                frames = sesion.extraer_clip()
+                lanzar_tarea(asyncio.to_thread(sesion.guardar_clip, frames))
+    except WebSocketDisconnect:
+        logger.info(f"Cámara desconectada: {usuario}")
+    except Exception as e:
+        logger.error(f"Error en ingesta de {usuario}: {str(e)}")
+    finally:
+        CONEXIONES.dec(tipo="websocket")
+        if deteccion is not None:
+            deteccion.cancel()
+        await asyncio.to_thread(sesion.cerrar)
+
+
+# Canal Server-Sent Events por usuario/unidad ("todos" recibe todo)
+@app.get("/eventos/{canal}")
+async def suscribir_eventos(canal: str, request: Request, x_kuntur_secreto: str = Header(None)):
+    """
+    Envía en vivo detecciones, evidencias, estado UPC y resoluciones.
+    Una cámara solo puede escuchar su propio canal (cookie de sesión del login);
+    otros canales, incluido "todos", piden el secreto compartido en X-Kuntur-Secreto.
+    """
+    if not secreto_valido(x_kuntur_secreto) and usuario_de_sesion(request.cookies.get(COOKIE_SESION)) != canal:
+        raise HTTPException(status_code=403, detail="Sin permiso para este canal")
+
+    cola = broker.suscribir(canal)
+    if cola is None:
+        raise HTTPException(status_code=503, detail="Demasiadas conexiones de eventos")
+
+    return StreamingResponse(
+        flujo_sse(broker, canal, cola),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Endpoint para publicar eventos desde el procesador local
+@app.post("/eventos")
+async def publicar_evento(evento: dict, request: Request, x_kuntur_secreto: str = Header(None)):
+    """
+    Requiere el secreto compartido EVENTOS_SECRETO en X-Kuntur-Secreto; si no está
+    configurado solo se aceptan publicaciones desde la misma máquina.
+
+    Ejemplo de JSON:
+    {
+        "tipo": "evidencia",
+        "datos": {"usuario": "user123", "url_evidencia": "https://.../video.mp4"},
+        "canales": ["user123", "unidad-12"]
+    }
+    """
+    local = request.client is not None and request.client.host in ("127.0.0.1", "::1")
+    if not (secreto_valido(x_kuntur_secreto) or (not EVENTOS_SECRETO and local)):
+        raise HTTPException(status_code=403, detail="Secreto de eventos inválido")
+    if "tipo" not in evento:
+        raise HTTPException(status_code=400, detail="Falta el campo tipo")
+
+    entregados = broker.publicar(evento["tipo"], evento.get("datos", {}), evento.get("canales", []))
+    return {"status": "success", "entregados": entregados}
+
+
+# Métricas en formato de texto de Prometheus
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metricas():
+    CONEXIONES.set(broker.total, tipo="sse")
+    if MODO_COLA == "mongo":
+        try:
+            COLA.set(await asyncio.to_thread(contar_pendientes), cola="mongo")
+        except Exception as e:
+            logger.error(f"Error contando trabajos pendientes: {e}")
+    return PlainTextResponse(registro.exposicion(), media_type="text/plain; version=0.0.4")
+
+
+# Endpoint para listar evidencias, de la más reciente a la más antigua
 @app.get("/evidencias")
-async def listar_evidencias():
-    """Obtener todas las evidencias (para pruebas)"""
+async def listar_evidencias(limite: int = 50, antes: str = None, usuario: str = None):
+    """
+    Página de evidencias. `antes` es el `siguiente` devuelto por la página
+    anterior (paginación por _id, sin skip).
+    """
+    limite = max(1, min(limite, 200))
+    filtro = {"usuario": usuario} if usuario else {}
+    if antes:
+        if not ObjectId.is_valid(antes):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        filtro["_id"] = {"$lt": ObjectId(antes)}
+
     try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["Kuntur"]
+        client = MongoClient(MONGO_LOCAL_URI)
+        db = client[KUNTUR_DB]
         collection = db["Evidencias"]
-        evidencias = list(collection.find({}, {"_id": 0}))
-        return {"evidencias": evidencias}
+        evidencias = list(collection.find(filtro).sort("_id", -1).limit(limite))
+        client.close()
+        for evidencia in evidencias:
+            evidencia["id"] = str(evidencia.pop("_id"))
+        siguiente = evidencias[-1]["id"] if len(evidencias) == limite else None
+        return {"evidencias": evidencias, "siguiente": siguiente}
     except Exception as e:
         return {"error": str(e)}
 
 
+def coleccion_evidencias():
+    return MongoClient(MONGO_LOCAL_URI)[KUNTUR_DB]["Evidencias"]
+
+
+# Incidentes cerca de un punto (mapa de la cámara)
+@app.get("/incidentes/cercanos")
+async def listar_incidentes_cercanos(lat: float, lon: float, radio: float = 2000, horas: float = 24,
+                                     limite: int = 50):
+    """Evidencias a menos de `radio` metros de (lat, lon) en las últimas `horas`"""
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or radio <= 0 or horas <= 0:
+        raise HTTPException(status_code=400, detail="Parámetros fuera de rango")
+
+    def buscar():
+        coleccion = coleccion_evidencias()
+        try:
+            return incidentes_cercanos(coleccion, lat, lon, radio, horas, max(1, min(limite, 200)))
+        finally:
+            coleccion.database.client.close()
+
+    try:
+        return {"incidentes": await asyncio.to_thread(buscar)}
+    except Exception as e:
+        logger.error(f"Error buscando incidentes cercanos: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Hotspots por celda de geohash (tableros de rutas)
+@app.get("/incidentes/hotspots")
+async def listar_hotspots(horas: float = 24, precision: int = 5, prefijo: str = ""):
+    """
+    Cantidad de incidentes por celda de geohash de `precision` caracteres
+    (5 ≈ 5 km, 6 ≈ 1 km). `prefijo` limita la consulta a una región.
+    Se reutiliza el resultado durante GEO_HOTSPOTS_TTL segundos.
+    """
+    if not 1 <= precision <= GEO_PRECISION:
+        raise HTTPException(status_code=400, detail=f"precision debe estar entre 1 y {GEO_PRECISION}")
+    if horas <= 0:
+        raise HTTPException(status_code=400, detail="horas debe ser mayor que 0")
+
+    def calcular():
+        coleccion = coleccion_evidencias()
+        try:
+            return agregar_hotspots(coleccion, horas, precision, prefijo)
+        finally:
+            coleccion.database.client.close()
+
+    try:
+        celdas = await asyncio.to_thread(cache_hotspots.obtener, (horas, precision, prefijo), calcular)
+        return {"hotspots": celdas, "precision": precision, "horas": horas}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error agregando hotspots: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # Endpoint para listar resoluciones (para pruebas)
 @app.get("/resoluciones")
 async def listar_resoluciones():
     """Obtener todas las resoluciones (para pruebas)"""
     try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["Kuntur"]
+        client = MongoClient(MONGO_LOCAL_URI)
+        db = client[KUNTUR_DB]
         collection = db["Resoluciones"]
         resoluciones = list(collection.find({}, {"_id": 0}))
         return {"resoluciones": resoluciones}
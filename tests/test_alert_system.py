@@ -0,0 +1,23 @@
+from utils import alert_system
+from utils.alert_system import VentanaAlertas
+
+
+def test_marcas_desordenadas_se_purgan_por_tiempo():
+    ventana = VentanaAlertas(ventana=30, umbral=3, enfriamiento=0)
+    # Un segmento atrasado llega después de uno más nuevo
+    assert ventana.registrar("bus1", "armaDetectada", 100) is None
+    assert ventana.registrar("bus1", "armaDetectada", 10) is None
+    assert ventana.registrar("bus1", "armaDetectada", 101) is None
+    assert ventana.estados[("bus1", "armaDetectada")].eventos == [100, 101]
+    assert ventana.registrar("bus1", "armaDetectada", 95) == "activada"
+
+
+def test_camaras_inactivas_se_olvidan(monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr(alert_system.time, "monotonic", lambda: reloj[0])
+    ventana = VentanaAlertas(ventana=30, umbral=3, enfriamiento=60, inactividad=600)
+    ventana.registrar("bus1", "armaDetectada", 1)
+
+    reloj[0] += 601
+    ventana.registrar("bus2", "armaDetectada", 2)
+    assert list(ventana.estados) == [("bus2", "armaDetectada")]
@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # utils.db_utils crea users.db en el directorio actual al importarse
+    monkeypatch.chdir(tmp_path)
+    from utils import cache_resultados
+    from utils.db_utils import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(cache_resultados, "Session", sessionmaker(bind=engine))
+    return cache_resultados
+
+
+def clip(directorio, nombre, contenido=b"segmento"):
+    ruta = directorio / nombre
+    ruta.write_bytes(contenido)
+    return str(ruta)
+
+
+def test_duplicado_con_otro_nombre_se_omite(cache, tmp_path):
+    huella, previo = cache.registrar_clip(clip(tmp_path, "bus1@1.mp4"))
+    assert previo is None
+    assert cache.procesar_con_huella(huella, lambda: cache.guardar_resultado(huella, {"alertas": []}))
+
+    _, previo = cache.registrar_clip(clip(tmp_path, "bus1@2.mp4"))
+    assert previo is not None
+    assert previo["resultados"] == {"alertas": []}
+
+
+def test_ruta_relativa_del_mismo_archivo_no_es_duplicado(cache, tmp_path):
+    # /upload-video registra data/videos/x.mp4 y el watcher informa ./data/videos/x.mp4
+    (tmp_path / "data" / "videos").mkdir(parents=True)
+    ruta = clip(tmp_path / "data" / "videos", "bus1@1.mp4")
+    contenido = open(ruta, "rb").read()
+    assert cache.registrar_huella(cache.huella_bytes(contenido), len(contenido), "data/videos/bus1@1.mp4") is None
+
+    _, previo = cache.registrar_clip("./data/videos/bus1@1.mp4")
+    assert previo is None
+
+
+@pytest.mark.parametrize("falla", ["excepcion", "sin_resultado"])
+def test_fallo_libera_la_huella_para_reintentar(cache, tmp_path, falla):
+    huella, _ = cache.registrar_clip(clip(tmp_path, "bus1@1.mp4"))
+
+    def procesar():
+        if falla == "excepcion":
+            raise RuntimeError("ffmpeg murió")
+        return False
+
+    if falla == "excepcion":
+        with pytest.raises(RuntimeError):
+            cache.procesar_con_huella(huella, procesar)
+    else:
+        assert not cache.procesar_con_huella(huella, procesar)
+
+    # Un reenvío del mismo contenido se procesa en lugar de tomarse como duplicado
+    _, previo = cache.registrar_clip(clip(tmp_path, "bus1@2.mp4"))
+    assert previo is None
+
+
+def test_reintento_del_mismo_archivo_se_procesa(cache, tmp_path):
+    ruta = clip(tmp_path, "bus1@1.mp4")
+    cache.registrar_clip(ruta)
+    _, previo = cache.registrar_clip(ruta)
+    assert previo is None
@@ -0,0 +1,21 @@
+import subprocess
+import sys
+
+import numpy as np
+
+from utils import ffmpeg_utils
+
+
+def test_pipe_roto_descarta_el_video(tmp_path, monkeypatch):
+    # "ffmpeg" que termina sin leer su entrada
+    popen = subprocess.Popen
+    monkeypatch.setattr(ffmpeg_utils.subprocess, "Popen",
+                        lambda cmd, **kwargs: popen([sys.executable, "-c", "pass"], **kwargs))
+
+    escritor = ffmpeg_utils.EscritorH264(str(tmp_path / "salida.mp4"), 10, (640, 480))
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    for _ in range(5):
+        escritor.write(frame)
+
+    assert escritor.fallido
+    assert escritor.release() is False
@@ -0,0 +1,22 @@
+import json
+
+from utils.incidentes import LineaTiempo
+
+
+def test_recorte_del_sidecar_queda_en_tiempo_del_clip(tmp_path):
+    linea = LineaTiempo(10)
+    for frame in (20, 55, 60, 90):
+        linea.agregar(frame, 1, [0, 0, 10, 10], 0.8)
+    ruta = linea.guardar_json(str(tmp_path / "segmento.json"), 640, 360)
+
+    cargada, ancho, alto = LineaTiempo.cargar_json(ruta)
+    assert (ancho, alto) == (640, 360)
+
+    # El clip empezó en el keyframe de 5.0 s aunque la ventana pedía 5.5 s
+    recorte = cargada.recortar(5.0, 6.5)
+    datos = json.loads(open(recorte.guardar_json(str(tmp_path / "clip.json"), ancho, alto)).read())
+    assert datos["detecciones"]["frame"] == [5, 10]
+    assert datos["incidentes"][0]["inicio"] == 0.5
+
+    vtt = open(recorte.guardar_webvtt(str(tmp_path / "clip.vtt"))).read()
+    assert "00:00:00.500 --> " in vtt
@@ -0,0 +1,21 @@
+import os
+
+from utils.retencion import GestorRetencion, Regla
+
+
+def test_no_borra_clips_de_trabajos_activos(tmp_path):
+    videos = tmp_path / "videos"
+    videos.mkdir()
+    rutas = []
+    for nombre in ("bus1@20260101_120000_000000.mp4", "bus1@20260101_120100_000000.mp4"):
+        ruta = videos / nombre
+        ruta.write_bytes(b"segmento")
+        os.utime(ruta, (0, 0))
+        rutas.append(str(ruta))
+
+    retencion = GestorRetencion({str(videos): Regla(edad=60)})
+    retencion.indexar_inicial()
+    retencion.aplicar(protegidos={os.path.basename(rutas[1])})
+
+    assert not os.path.exists(rutas[0])
+    assert os.path.exists(rutas[1])
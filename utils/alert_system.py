@@ -1,12 +1,24 @@
+import bisect
+import os
+import threading
+import time
+from collections import deque
 from datetime import datetime
 
+# Configuración (usar variables de entorno)
+ALERTA_VENTANA = float(os.getenv("ALERTA_VENTANA", 30))  # Segundos de la ventana deslizante
+ALERTA_UMBRAL = int(os.getenv("ALERTA_UMBRAL", 3))  # Detecciones para activar
+ALERTA_UMBRAL_BAJO = int(os.getenv("ALERTA_UMBRAL_BAJO", 0))  # Detecciones para desactivar (histéresis)
+ALERTA_ENFRIAMIENTO = float(os.getenv("ALERTA_ENFRIAMIENTO", 60))  # Segundos mínimos entre activaciones
+ALERTA_INACTIVIDAD = float(os.getenv("ALERTA_INACTIVIDAD", 600))  # Segundos sin uso antes de olvidar una cámara
+
 
 class SistemaAlertas:
     def __init__(self):
         self.alerta = False
         self.tipo = ''
         self.inicio = None
-        self.log_interacciones = []
+        self.log_interacciones = deque()
         self.justificacion = ''
 
     def activar(self, tipo):
@@ -27,7 +39,113 @@ class SistemaAlertas:
         self.log_interacciones.append(ahora)
 
         # Mantener solo interacciones de los últimos 30 segundos
-        self.log_interacciones = [t for t in self.log_interacciones if (ahora - t).seconds <= 30]
+        while (ahora - self.log_interacciones[0]).total_seconds() > 30:
+            self.log_interacciones.popleft()
 
         # Activar alerta si hay suficientes interacciones en el período
-        return len(self.log_interacciones) >= count
\ No newline at end of file
+        return len(self.log_interacciones) >= count
+
+
+class EstadoAlerta:
+    """Ventana de detecciones de una cámara para un tipo de alerta"""
+
+    __slots__ = ("eventos", "activa", "inicio", "ultima_activacion", "visto")
+
+    def __init__(self):
+        self.eventos = []  # Marcas de tiempo ordenadas
+        self.activa = False
+        self.inicio = None
+        self.ultima_activacion = None
+        self.visto = time.monotonic()
+
+
+class VentanaAlertas:
+    """
+    Máquina de estados de alertas por (cámara, tipo).
+    Cada detección se registra en una ventana deslizante (lista ordenada de
+    marcas de tiempo en segundos); la alerta se activa al llegar a `umbral`
+    detecciones, se desactiva solo cuando la ventana baja a `umbral_bajo`
+    (histéresis) y no vuelve a activarse antes de `enfriamiento` segundos.
+    Las marcas pueden llegar desordenadas (segmentos procesados fuera de
+    orden), así que la ventana se mide desde la más reciente. Las cámaras sin
+    uso durante `inactividad` segundos se olvidan.
+    """
+
+    def __init__(self, ventana=ALERTA_VENTANA, umbral=ALERTA_UMBRAL,
+                 umbral_bajo=ALERTA_UMBRAL_BAJO, enfriamiento=ALERTA_ENFRIAMIENTO,
+                 inactividad=ALERTA_INACTIVIDAD):
+        self.ventana = ventana
+        self.umbral = umbral
+        self.umbral_bajo = umbral_bajo
+        self.enfriamiento = enfriamiento
+        # Olvidar antes de que venza el enfriamiento permitiría reactivar antes de tiempo
+        self.inactividad = max(inactividad, ventana, enfriamiento)
+        self.estados = {}
+        self._proxima_limpieza = time.monotonic() + self.inactividad
+        self._lock = threading.Lock()
+
+    def _purgar(self, estado, ahora):
+        """Descarta las marcas fuera de la ventana que termina en la marca más reciente"""
+        eventos = estado.eventos
+        limite = max(ahora, eventos[-1] if eventos else ahora) - self.ventana
+        del eventos[:bisect.bisect_left(eventos, limite)]
+
+    def _olvidar_inactivas(self):
+        """Elimina los estados sin uso reciente (a lo sumo una vez por período de inactividad)"""
+        reloj = time.monotonic()
+        if reloj < self._proxima_limpieza:
+            return
+        self._proxima_limpieza = reloj + self.inactividad
+        for clave in [c for c, e in self.estados.items() if reloj - e.visto > self.inactividad]:
+            del self.estados[clave]
+
+    def _estado(self, camara, tipo, crear):
+        self._olvidar_inactivas()
+        estado = self.estados.get((camara, tipo))
+        if estado is None and crear:
+            estado = self.estados[(camara, tipo)] = EstadoAlerta()
+        if estado is not None:
+            estado.visto = time.monotonic()
+        return estado
+
+    def registrar(self, camara, tipo, ahora=None):
+        """Registra una detección y devuelve "activada" si la alerta escala"""
+        ahora = time.time() if ahora is None else ahora
+        with self._lock:
+            estado = self._estado(camara, tipo, crear=True)
+
+            bisect.insort(estado.eventos, ahora)
+            self._purgar(estado, ahora)
+
+            if estado.activa or len(estado.eventos) < self.umbral:
+                return None
+            if estado.ultima_activacion is not None and abs(ahora - estado.ultima_activacion) < self.enfriamiento:
+                return None
+
+            estado.activa = True
+            estado.inicio = ahora
+            estado.ultima_activacion = ahora
+            return "activada"
+
+    def actualizar(self, camara, tipo, ahora=None):
+        """Avanza la ventana sin detección y devuelve "desactivada" si la alerta termina"""
+        ahora = time.time() if ahora is None else ahora
+        with self._lock:
+            estado = self._estado(camara, tipo, crear=False)
+            if estado is None or not estado.activa:
+                return None
+
+            self._purgar(estado, ahora)
+            if len(estado.eventos) > self.umbral_bajo:
+                return None
+
+            estado.activa = False
+            return "desactivada"
+
+    def activa(self, camara, tipo):
+        estado = self.estados.get((camara, tipo))
+        return estado is not None and estado.activa
+
+
+# Estado compartido por todas las cámaras de este proceso
+ventana_alertas = VentanaAlertas()
@@ -11,8 +11,13 @@ from PIL import Image
 from transformers import pipeline
 from faster_whisper import WhisperModel
 from utils.llm_utils import generar_descripcion_enriquecida
+from utils.eventos import notificar_evento, KUNTUR_API_URL
+from utils.metricas import medir, trace_actual
+from utils.geo import normalizar_ubicacion, ultima_ubicacion
+from utils.incidentes import INCIDENTE_SEPARACION
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
+from bson import ObjectId
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
@@ -25,23 +30,40 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Cargar modelos
-whisper_model = WhisperModel("small", device="cpu", compute_type="int8")
-blip_pipe = pipeline("image-to-text", model="Salesforce/blip-image-captioning-base")
+# Modelos: se cargan en el primer uso (benchmarks/pipeline.py los reemplaza por stubs)
+whisper_model = None
+blip_pipe = None
 
 # Configurar MongoDB
+MONGO_LOCAL_URI = os.getenv("MONGO_LOCAL_URI", "mongodb://localhost:27017/")  # Evidencias y alertas
+KUNTUR_DB = os.getenv("KUNTUR_DB", "Kuntur")  # Base de evidencias y alertas en MONGO_LOCAL_URI
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB = os.getenv("MONGO_DB", "kuntur_db")
 MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "alertas")
 
 
+def modelo_whisper():
+    global whisper_model
+    if whisper_model is None:
+        whisper_model = WhisperModel("small", device="cpu", compute_type="int8")
+    return whisper_model
+
+
+def modelo_blip():
+    global blip_pipe
+    if blip_pipe is None:
+        blip_pipe = pipeline("image-to-text", model="Salesforce/blip-image-captioning-base")
+    return blip_pipe
+
+
 def guardar_json_mongodb(db_name, collection_name, data):
     """Guarda un documento JSON en MongoDB local"""
     try:
-        client = MongoClient("mongodb://localhost:27017/")
+        client = MongoClient(MONGO_LOCAL_URI)
         db = client[db_name]
         collection = db[collection_name]
-        result = collection.insert_one(data)
+        with medir("mongo_insert"):
+            result = collection.insert_one(data)
         logger.info(f"JSON guardado en MongoDB: {collection_name} - ID: {result.inserted_id}")
         return True
     except Exception as e:
@@ -51,19 +73,56 @@ def guardar_json_mongodb(db_name, collection_name, data):
         client.close()
 
 
-def notificacion_a_upc(url_evidencia, descripcion):
+def actualizar_evidencia(id_evidencia, visual_data):
+    """Agrega a una evidencia existente los incidentes y ventanas de un segmento que la continúa"""
+    try:
+        client = MongoClient(MONGO_LOCAL_URI)
+        base_url = os.getenv("B2_PUBLIC_BASE_URL", "https://f005.backblazeb2.com/file/evidenciaskunturmovilidad/")
+        ventanas = [
+            {"inicio": v["inicio"], "fin": v["fin"], "url": f"{base_url}{v['b2_path']}",
+             "detecciones": {formato: f"{base_url}{ruta}" for formato, ruta in v.get("sidecar_b2", {}).items()}}
+            for v in visual_data.get("ventanas", [])
+        ]
+        cambios = {
+            "$push": {
+                "incidentes": {"$each": visual_data.get("alertas", [])},
+                "ventanas": {"$each": ventanas},
+                "traces": trace_actual.get()
+            },
+            "$set": {"fecha_actualizacion": datetime.now().isoformat()},
+            "$inc": {"segmentos": 1}
+        }
+        intervalo = visual_data.get("intervalo")
+        if intervalo:
+            cambios["$min"] = {"intervalo.desde": intervalo["desde"]}
+            cambios["$max"] = {"intervalo.hasta": intervalo["hasta"]}
+        with medir("mongo_update"):
+            result = client[KUNTUR_DB]["Evidencias"].update_one({"_id": ObjectId(id_evidencia)}, cambios)
+        logger.info(f"Evidencia {id_evidencia} actualizada con un segmento continuo")
+        return result.modified_count == 1
+    except Exception as e:
+        logger.error(f"Error actualizando evidencia {id_evidencia}: {e}")
+        return False
+    finally:
+        client.close()
+
+
+def notificacion_a_upc(url_evidencia, descripcion, usuario):
     """Envía notificación a UPC usando el endpoint FastAPI"""
     try:
         # Construir evidencia básica
         evidencia = {
             "descripcion": descripcion,
             "url_evidencia": url_evidencia,
-            "fecha": datetime.now().isoformat()
+            "usuario": usuario,
+            "fecha": datetime.now().isoformat(),
+            "trace_id": trace_actual.get()
         }
 
         # Llamar al endpoint local de FastAPI
-        local_upc_endpoint = "http://localhost:8000/enviar-evidencia-upc"
-        response = requests.post(local_upc_endpoint, json=evidencia, timeout=5)
+        local_upc_endpoint = f"{KUNTUR_API_URL}/enviar-evidencia-upc"
+        with medir("upc_notificacion"):
+            response = requests.post(local_upc_endpoint, json=evidencia, timeout=5)
 
         if response.status_code == 200:
             logger.info("Notificación enviada a UPC a través de FastAPI")
@@ -106,6 +165,55 @@ def get_location_by_ip(ip):
     return {"latitud": 0, "longitud": 0}
 
 
+def evidencia_solapada(usuario, incidentes, margen=INCIDENTE_SEPARACION):
+    """
+    Id de una evidencia del usuario que ya cubre todos los `incidentes` ((desde, hasta)
+    en hora real), p. ej. la del clip en vivo cuando llega el segmento del mismo momento.
+    None si alguno de ellos no estaba registrado (debe ir como evidencia nueva).
+    """
+    if not incidentes:
+        return None
+    desde = min(d for d, _ in incidentes)
+    hasta = max(h for _, h in incidentes)
+    try:
+        client = MongoClient(MONGO_LOCAL_URI)
+        try:
+            coleccion = client[KUNTUR_DB]["Evidencias"]
+            coleccion.create_index([("usuario", 1), ("intervalo.hasta", 1)])
+            evidencia = coleccion.find_one(
+                {"usuario": usuario, "intervalo.desde": {"$lte": hasta + margen},
+                 "intervalo.hasta": {"$gte": desde - margen}},
+                {"intervalo": 1},
+                sort=[("intervalo.hasta", -1)]
+            )
+        finally:
+            client.close()
+    except Exception as e:
+        logger.error(f"Error buscando evidencias solapadas de {usuario}: {e}")
+        return None
+
+    if evidencia is None:
+        return None
+    intervalo = evidencia["intervalo"]
+    cubiertos = all(d <= intervalo["hasta"] + margen and h >= intervalo["desde"] - margen for d, h in incidentes)
+    return str(evidencia["_id"]) if cubiertos else None
+
+
+def ubicacion_camara(usuario):
+    """Última posición enviada por la cámara; si no hay una reciente, la de la IP pública"""
+    try:
+        client = MongoClient(MONGO_LOCAL_URI)
+        try:
+            punto = ultima_ubicacion(client[KUNTUR_DB]["Ubicaciones"], usuario)
+        finally:
+            client.close()
+        if punto is not None:
+            return punto
+    except Exception as e:
+        logger.error(f"Error obteniendo ubicación de {usuario}: {e}")
+    return get_location_by_ip(get_public_ip())
+
+
 def extract_audio(video_path, audio_path):
     """Extraer audio de un video usando FFmpeg"""
     try:
@@ -119,7 +227,8 @@ def extract_audio(video_path, audio_path):
             "-y",
             audio_path
         ]
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with medir("ffmpeg_audio"):
+            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         return True
     except Exception as e:
         logger.error(f"Error extrayendo audio: {e}")
@@ -129,8 +238,10 @@ def extract_audio(video_path, audio_path):
 def transcribe_audio(audio_path):
     """Transcribir audio usando Whisper"""
     try:
-        segments, _ = whisper_model.transcribe(audio_path, language="es", beam_size=5)
-        return " ".join(segment.text for segment in segments)
+        with medir("whisper"):
+            # Los segmentos se generan de forma perezosa: se consumen dentro de la medición
+            segments, _ = modelo_whisper().transcribe(audio_path, language="es", beam_size=5)
+            return " ".join(segment.text for segment in segments)
     except Exception as e:
         logger.error(f"Error transcribiendo audio: {e}")
         return ""
@@ -143,7 +254,8 @@ def analyze_frames(frame_paths):
         try:
             image = Image.open(frame_path).convert("RGB")
             # Especificar max_new_tokens para evitar advertencias y controlar longitud
-            result = blip_pipe(image, max_new_tokens=20)
+            with medir("blip"):
+                result = modelo_blip()(image, max_new_tokens=20)
             captions.append(result[0]['generated_text'])
         except Exception as e:
             logger.error(f"Error analizando frame {frame_path}: {e}")
@@ -173,26 +285,51 @@ def procesar_audio(video_path, visual_data, username, video_filename, b2_path):
     public_url = f"{base_url}{b2_path}"
 
     # Construir objeto evidencia
+    with medir("llm"):
+        descripcion = generar_descripcion_enriquecida(visual_data, transcription, frame_captions)
     evidencia = {
-        "descripcion": generar_descripcion_enriquecida(visual_data, transcription, frame_captions),
-        "ubicacion": get_location_by_ip(get_public_ip()),
+        "descripcion": descripcion,
+        "ubicacion": visual_data.get("ubicacion") or ubicacion_camara(username),
         "ip_camara": os.getenv("CAM_IP", ""),
         "usuario": username,
         "url_evidencia": public_url,
         "fecha": datetime.now().isoformat(),
         "b2_path": b2_path,
+        "segmentos": 1,
+        "incidentes": visual_data.get("alertas", []),
+        "ventanas": [
+            {"inicio": v["inicio"], "fin": v["fin"], "url": f"{base_url}{v['b2_path']}",
+             "detecciones": {formato: f"{base_url}{ruta}" for formato, ruta in v.get("sidecar_b2", {}).items()}}
+            for v in visual_data.get("ventanas", [])
+        ],
+        "detecciones": {formato: f"{base_url}{ruta}" for formato, ruta in visual_data.get("sidecar_b2", {}).items()},
+        "traces": [trace_actual.get()],  # Un trace por segmento (ver utils/metricas.py)
         "estado": "nuevo"  # Estado inicial: nuevo
     }
+    if visual_data.get("intervalo"):
+        # Hora real de los incidentes: los clips del mismo momento se agregan a esta evidencia
+        evidencia["intervalo"] = visual_data["intervalo"]
+
+    # GeoJSON + geohash para las consultas por cercanía y los hotspots
+    normalizar_ubicacion(evidencia)
 
     # Guardar en MongoDB local (colección Evidencias)
-    guardar_json_mongodb("Kuntur", "Evidencias", evidencia)
+    guardar_json_mongodb(KUNTUR_DB, "Evidencias", evidencia)
+    notificar_evento("evidencia", {
+        "id_evidencia": str(evidencia.get("_id", "")),
+        "usuario": username,
+        "url_evidencia": public_url,
+        "descripcion": evidencia["descripcion"]
+    }, [username])
 
     # Enviar notificación a UPC
-    notificacion_a_upc(public_url, evidencia["descripcion"])
+    notificacion_a_upc(public_url, evidencia["descripcion"], username)
 
     # Limpiar archivos temporales
     try:
         for frame_path in visual_data.get("key_frames", []):
             os.remove(frame_path)
     except Exception as e:
-        logger.error(f"Error eliminando archivos temporales: {e}")
\ No newline at end of file
+        logger.error(f"Error eliminando archivos temporales: {e}")
+
+    return evidencia
\ No newline at end of file
@@ -4,6 +4,8 @@ import hashlib
 import logging
 import time
 
+from utils.metricas import BYTES, ETAPA_SEGUNDOS, THROUGHPUT
+
 # Configura logging
 logging.basicConfig(
     level=logging.INFO,
@@ -11,10 +13,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Configuración (usar variables de entorno)
+B2_API_URL = os.getenv("B2_API_URL", "https://api.backblazeb2.com")  # Otro valor apunta a un servidor de pruebas
+
 
 def obtener_token_acceso(key_id, app_key):
     """Obtiene token de acceso usando el endpoint correcto"""
-    auth_url = "https://api.backblazeb2.com/b2api/v2/b2_authorize_account"
+    auth_url = f"{B2_API_URL}/b2api/v2/b2_authorize_account"
     try:
         logger.info(f"Autenticando con Backblaze usando keyID: {key_id[:5]}...")
         response = requests.get(auth_url, auth=(key_id, app_key), timeout=30)
@@ -30,7 +35,7 @@ def obtener_token_acceso(key_id, app_key):
 def subir_video_b2(video_path, nombre_archivo, key_id, app_key, bucket_id):
     """
     Sube un video a Backblaze B2 usando el bucket ID directamente
-    :return: True si la subida fue exitosa, False en caso contrario
+    :return: el fileId de B2 (o True) si la subida fue exitosa, False en caso contrario
     """
     # 1. Autenticación
     auth_data = obtener_token_acceso(key_id, app_key)
@@ -67,7 +72,7 @@ def subir_video_b2(video_path, nombre_archivo, key_id, app_key, bucket_id):
         # Cabeceras
         upload_headers = {
             "Authorization": upload_data["authorizationToken"],
-            "Content-Type": "application/octet-stream",
+            "Content-Type": "b2/x-auto",  # B2 deduce el tipo por la extensión (mp4, json, vtt)
             "X-Bz-File-Name": nombre_archivo,
             "X-Bz-Content-Sha1": sha1,
             "Content-Length": str(file_size)
@@ -84,10 +89,15 @@ def subir_video_b2(video_path, nombre_archivo, key_id, app_key, bucket_id):
         )
         response.raise_for_status()
         elapsed = time.time() - start_time
+        ETAPA_SEGUNDOS.observe(elapsed, etapa="b2_subida")
+        BYTES.inc(file_size, destino="b2_subida")
+        if elapsed > 0:
+            THROUGHPUT.observe(file_size / 1024 / 1024 / elapsed, destino="b2_subida")
 
         logger.info(
             f"✅ Video subido exitosamente: {nombre_archivo} ({file_size / 1024 / 1024:.2f} MB en {elapsed:.1f}s)")
-        return True
+        # El fileId permite descargarlo luego con download_file_from_bucket
+        return response.json().get("fileId") or True
 
     except Exception as e:
         logger.error(f"Error en subida: {str(e)}")
@@ -117,10 +127,14 @@ def download_file_from_bucket(key_id, app_key, file_id, local_path):
 
         file_size = os.path.getsize(local_path)
         elapsed = time.time() - start_time
+        ETAPA_SEGUNDOS.observe(elapsed, etapa="b2_descarga")
+        BYTES.inc(file_size, destino="b2_descarga")
+        if elapsed > 0:
+            THROUGHPUT.observe(file_size / 1024 / 1024 / elapsed, destino="b2_descarga")
         logger.info(
-            f"Video subido exitosamente: {nombre_archivo} ({file_size / 1024 / 1024:.2f} MB en {elapsed:.1f}s)")
+            f"Archivo descargado exitosamente: {local_path} ({file_size / 1024 / 1024:.2f} MB en {elapsed:.1f}s)")
         return True
 
     except Exception as e:
-        logger.error(f"Error en subida: {str(e)}")
+        logger.error(f"Error en descarga: {str(e)}")
         return False
\ No newline at end of file
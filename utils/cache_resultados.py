@@ -0,0 +1,159 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+from utils.db_utils import Session, ResultadoCache, init_db
+
+# Configura logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuración (usar variables de entorno)
+CACHE_MAX_EDAD = float(os.getenv("CACHE_MAX_EDAD", 24 * 3600))  # Segundos que se conserva un resultado
+CACHE_PENDIENTE_MAX = float(os.getenv("CACHE_PENDIENTE_MAX", 900))  # Un clip "en proceso" más viejo se reprocesa
+
+# Asegurar que la tabla exista también cuando solo corre local_processor.py
+init_db()
+
+
+def huella_bytes(datos):
+    return hashlib.sha256(datos).hexdigest()
+
+
+def huella_archivo(ruta, bloque=1024 * 1024):
+    """sha256 del archivo leído por bloques (no carga el video completo en memoria)"""
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for parte in iter(lambda: f.read(bloque), b""):
+            sha.update(parte)
+    return sha.hexdigest()
+
+
+def registrar_huella(huella, tamano, ruta):
+    """
+    Registra un clip entrante. Devuelve la entrada existente (dict) si el mismo
+    contenido ya fue recibido y sigue vigente, o None si es nuevo.
+    """
+    session = Session()
+    try:
+        ahora = time.time()
+        entrada = session.get(ResultadoCache, huella)
+        if entrada is not None and entrada.tamano == tamano:
+            vigente = ahora - entrada.creado <= CACHE_MAX_EDAD
+            en_proceso = entrada.resultados is None
+            if vigente and not (en_proceso and ahora - entrada.creado > CACHE_PENDIENTE_MAX):
+                return a_dict(entrada)
+
+        if entrada is None:
+            entrada = ResultadoCache(huella=huella)
+            session.add(entrada)
+        entrada.tamano = tamano
+        entrada.ruta = ruta
+        entrada.resultados = None
+        entrada.b2_path = None
+        entrada.duracion = None
+        entrada.creado = ahora
+        session.commit()
+        return None
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error registrando huella {huella[:12]}: {e}")
+        return None
+    finally:
+        session.close()
+
+
+def registrar_clip(ruta):
+    """
+    Registra la huella de un clip a procesar. Devuelve (huella, previo): previo es
+    la entrada existente si el mismo contenido ya llegó con otro nombre de archivo.
+    Se comparan nombres y no rutas: /upload-video guarda data/videos/x.mp4 y el
+    watcher informa ./data/videos/x.mp4. El mismo nombre es un reintento del clip.
+    """
+    huella = huella_archivo(ruta)
+    previo = registrar_huella(huella, os.path.getsize(ruta), ruta)
+    if previo is not None and os.path.basename(previo["ruta"]) == os.path.basename(ruta):
+        previo = None
+    return huella, previo
+
+
+def procesar_con_huella(huella, procesar, *args):
+    """
+    Ejecuta procesar(*args), que debe devolver True solo si guardó el resultado.
+    En cualquier otra salida (False, None o excepción) se descarta la huella para
+    que un reintento del mismo contenido no se tome como duplicado.
+    """
+    guardado = False
+    try:
+        guardado = procesar(*args)
+        return guardado
+    finally:
+        if not guardado:
+            descartar_huella(huella)
+
+
+def guardar_resultado(huella, resultados, b2_path=None):
+    """Guarda el resultado del análisis de un clip ya registrado"""
+    session = Session()
+    try:
+        entrada = session.get(ResultadoCache, huella)
+        if entrada is None:
+            return False
+        entrada.resultados = json.dumps(resultados, default=str)
+        entrada.duracion = resultados.get("duracion")
+        entrada.b2_path = b2_path
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error guardando resultado {huella[:12]}: {e}")
+        return False
+    finally:
+        session.close()
+
+
+def descartar_huella(huella):
+    """Quita una entrada (p. ej. si el procesamiento falló) para permitir reintentos"""
+    session = Session()
+    try:
+        session.query(ResultadoCache).filter(ResultadoCache.huella == huella).delete()
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error descartando huella {huella[:12]}: {e}")
+    finally:
+        session.close()
+
+
+def purgar_cache(max_edad=CACHE_MAX_EDAD):
+    """Elimina las entradas más viejas que `max_edad` segundos"""
+    session = Session()
+    try:
+        borradas = session.query(ResultadoCache).filter(ResultadoCache.creado < time.time() - max_edad).delete()
+        session.commit()
+        if borradas:
+            logger.info(f"Cache de resultados: {borradas} entradas eliminadas")
+        return borradas
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error purgando cache: {e}")
+        return 0
+    finally:
+        session.close()
+
+
+def a_dict(entrada):
+    return {
+        "huella": entrada.huella,
+        "tamano": entrada.tamano,
+        "duracion": entrada.duracion,
+        "ruta": entrada.ruta,
+        "resultados": json.loads(entrada.resultados) if entrada.resultados else None,
+        "b2_path": entrada.b2_path,
+        "creado": entrada.creado
+    }
@@ -0,0 +1,186 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, MongoClient, ReturnDocument
+
+from utils.backblaze_utils import download_file_from_bucket
+
+# Configura logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuración (usar variables de entorno)
+MODO_COLA = os.getenv("MODO_COLA", "local")  # local (carpeta vigilada) | mongo (cola compartida)
+TRABAJOS_MONGO_URI = os.getenv("TRABAJOS_MONGO_URI", os.getenv("MONGO_URI") or "mongodb://localhost:27017/")
+KUNTUR_DB = os.getenv("KUNTUR_DB", "Kuntur")
+TRABAJOS_VISIBILIDAD = float(os.getenv("TRABAJOS_VISIBILIDAD", 120))  # Segundos de lease por reclamo
+TRABAJOS_LATIDO = float(os.getenv("TRABAJOS_LATIDO", 30))  # Cada cuánto se renueva el lease
+TRABAJOS_MAX_INTENTOS = int(os.getenv("TRABAJOS_MAX_INTENTOS", 3))
+
+# Clips descargados de B2 cuando la ruta compartida no es visible en este nodo
+CARPETA_DESCARGAS = os.path.join("data", "trabajos")
+
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+
+_coleccion = None
+
+
+def coleccion_trabajos():
+    """Colección KUNTUR_DB.Trabajos (un cliente por proceso, con sus índices)"""
+    global _coleccion
+    if _coleccion is None:
+        coleccion = MongoClient(TRABAJOS_MONGO_URI)[KUNTUR_DB]["Trabajos"]
+        coleccion.create_index([("estado", ASCENDING), ("prioridad", DESCENDING), ("creado", ASCENDING)])
+        coleccion.create_index([("estado", ASCENDING), ("lease_hasta", ASCENDING)])
+        coleccion.create_index([("usuario", ASCENDING), ("estado", ASCENDING)])
+        _coleccion = coleccion
+    return _coleccion
+
+
+def encolar_trabajo(ruta, usuario, prioridad=0, b2_file_id=None):
+    """Publica un clip para que lo procese cualquier nodo"""
+    trabajo = {
+        "ruta": os.path.abspath(ruta),
+        "usuario": usuario,
+        "b2_file_id": b2_file_id,
+        "estado": "pendiente",
+        "prioridad": prioridad,
+        "intentos": 0,
+        "worker": None,
+        "lease_hasta": 0,
+        "creado": time.time(),
+        "fecha": datetime.now().isoformat()
+    }
+    result = coleccion_trabajos().insert_one(trabajo)
+    return str(result.inserted_id)
+
+
+def reclamar_trabajo(worker_id=WORKER_ID):
+    """
+    Toma el trabajo pendiente más prioritario (o uno cuyo lease venció porque
+    su nodo murió) y lo deja invisible para los demás durante TRABAJOS_VISIBILIDAD.
+    """
+    coleccion = coleccion_trabajos()
+    ahora = time.time()
+
+    # Trabajos abandonados que ya agotaron sus intentos
+    coleccion.update_many(
+        {"estado": "en_proceso", "lease_hasta": {"$lt": ahora}, "intentos": {"$gte": TRABAJOS_MAX_INTENTOS}},
+        {"$set": {"estado": "fallido", "error": "Lease vencido sin más intentos"}}
+    )
+
+    return coleccion.find_one_and_update(
+        {
+            "$or": [
+                {"estado": "pendiente"},
+                {"estado": "en_proceso", "lease_hasta": {"$lt": ahora}}
+            ],
+            "intentos": {"$lt": TRABAJOS_MAX_INTENTOS}
+        },
+        {
+            "$set": {"estado": "en_proceso", "worker": worker_id, "lease_hasta": ahora + TRABAJOS_VISIBILIDAD},
+            "$inc": {"intentos": 1}
+        },
+        sort=[("prioridad", DESCENDING), ("creado", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def renovar_lease(id_trabajo, worker_id=WORKER_ID):
+    """Extiende el lease; False si otro nodo ya se quedó con el trabajo"""
+    result = coleccion_trabajos().update_one(
+        {"_id": id_trabajo, "worker": worker_id, "estado": "en_proceso"},
+        {"$set": {"lease_hasta": time.time() + TRABAJOS_VISIBILIDAD}}
+    )
+    return result.modified_count == 1
+
+
+def completar_trabajo(id_trabajo, worker_id=WORKER_ID):
+    coleccion_trabajos().update_one(
+        {"_id": id_trabajo, "worker": worker_id},
+        {"$set": {"estado": "hecho", "terminado": time.time()}}
+    )
+
+
+def fallar_trabajo(trabajo, error, worker_id=WORKER_ID):
+    """Devuelve el trabajo a la cola o lo marca fallido si agotó sus intentos"""
+    estado = "fallido" if trabajo.get("intentos", 0) >= TRABAJOS_MAX_INTENTOS else "pendiente"
+    coleccion_trabajos().update_one(
+        {"_id": trabajo["_id"], "worker": worker_id},
+        {"$set": {"estado": estado, "error": str(error), "lease_hasta": 0}}
+    )
+
+
+def priorizar_usuario(usuario, prioridad=1):
+    """Adelanta los clips pendientes de una cámara (botón de pánico)"""
+    result = coleccion_trabajos().update_many(
+        {"usuario": usuario, "estado": {"$in": ["pendiente", "en_proceso"]}},
+        {"$set": {"prioridad": prioridad}}
+    )
+    return result.modified_count
+
+
+def contar_pendientes():
+    return coleccion_trabajos().count_documents({"estado": "pendiente"})
+
+
+def nombres_activos():
+    """
+    Nombres de archivo de los trabajos pendientes o en proceso (de cualquier nodo).
+    Se compara por nombre porque cada nodo puede montar la carpeta compartida en
+    otra ruta o tener el clip descargado de B2; usuario@timestamp no se repite.
+    """
+    cursor = coleccion_trabajos().find({"estado": {"$in": ["pendiente", "en_proceso"]}}, {"ruta": 1, "_id": 0})
+    return {os.path.basename(trabajo["ruta"]) for trabajo in cursor}
+
+
+def obtener_clip(trabajo, key_id, app_key):
+    """Ruta local del clip: la compartida si es visible, si no se descarga de B2"""
+    if os.path.exists(trabajo["ruta"]):
+        return trabajo["ruta"]
+
+    if not trabajo.get("b2_file_id"):
+        raise FileNotFoundError(f"Clip no accesible y sin copia en B2: {trabajo['ruta']}")
+
+    os.makedirs(CARPETA_DESCARGAS, exist_ok=True)
+    local_path = os.path.join(CARPETA_DESCARGAS, os.path.basename(trabajo["ruta"]))
+    if not download_file_from_bucket(key_id, app_key, trabajo["b2_file_id"], local_path):
+        raise IOError(f"No se pudo descargar {trabajo['b2_file_id']} de B2")
+    return local_path
+
+
+class Latido(threading.Thread):
+    """Renueva el lease de un trabajo mientras se procesa"""
+
+    def __init__(self, id_trabajo, worker_id=WORKER_ID, intervalo=TRABAJOS_LATIDO):
+        super().__init__(daemon=True)
+        self.id_trabajo = id_trabajo
+        self.worker_id = worker_id
+        self.intervalo = intervalo
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                if not renovar_lease(self.id_trabajo, self.worker_id):
+                    logger.warning(f"Lease perdido para el trabajo {self.id_trabajo}")
+                    return
+            except Exception as e:
+                logger.error(f"Error renovando lease de {self.id_trabajo}: {e}")
+
+    def detener(self):
+        self._detener.set()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.detener()
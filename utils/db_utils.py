@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy import Column, Integer, Float, String, Text, create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import bcrypt
@@ -18,6 +18,17 @@ class User(Base):
     chofer = Column(String, nullable=False)
     ip_camara = Column(String, nullable=False)
 
+# Resultados de análisis por huella de contenido (evita reprocesar subidas duplicadas)
+class ResultadoCache(Base):
+    __tablename__ = 'resultados_cache'
+    huella = Column(String, primary_key=True)  # sha256 del contenido
+    tamano = Column(Integer, nullable=False)
+    duracion = Column(Float)
+    ruta = Column(String)  # Archivo que originó la entrada
+    resultados = Column(Text)  # JSON; vacío mientras se procesa
+    b2_path = Column(String)
+    creado = Column(Float, nullable=False, index=True)
+
 # Crear las tablas si no existen
 def init_db():
     Base.metadata.create_all(engine)
@@ -1,5 +1,6 @@
 import numpy as np
 
+
 def calcular_distancia_real(box1, box2, forma_frame):
     h, w = forma_frame[:2]
     y_base1, y_base2 = box1[3], box2[3]
@@ -12,4 +13,59 @@ def calcular_distancia_real(box1, box2, forma_frame):
     cx2, cy2 = (box2[0]+box2[2])/2, (box2[1]+box2[3])/2
     dpix = np.hypot(cx1-cx2, cy1-cy2)
     fprof = abs(cy1-cy2)/h * 2
-    return dpix * escala * (1 + fprof)
\ No newline at end of file
+    return dpix * escala * (1 + fprof)
+
+
+def calcular_distancias_matriz(cajas1, cajas2, forma_frame):
+    """
+    Versión vectorizada de calcular_distancia_real: recibe arrays (N,4) y (M,4)
+    de cajas x1, y1, x2, y2 y devuelve la matriz (N,M) de distancias en metros.
+    """
+    h = forma_frame[0]
+    a = np.asarray(cajas1, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(cajas2, dtype=np.float64).reshape(-1, 4)
+
+    # Altura corregida por perspectiva (más abajo en la imagen = más cerca)
+    altura_a = (a[:, 3] - a[:, 1]) * (1 + (a[:, 3] / h) * 0.7)
+    altura_b = (b[:, 3] - b[:, 1]) * (1 + (b[:, 3] / h) * 0.7)
+    with np.errstate(divide='ignore'):
+        escala = 1.7 / ((altura_a[:, None] + altura_b[None, :]) / 2)
+
+    dx = (a[:, 0] + a[:, 2])[:, None] / 2 - (b[:, 0] + b[:, 2])[None, :] / 2
+    dy = (a[:, 1] + a[:, 3])[:, None] / 2 - (b[:, 1] + b[:, 3])[None, :] / 2
+    dpix = np.hypot(dx, dy)
+    fprof = np.abs(dy) / h * 2
+    return dpix * escala * (1 + fprof)
+
+
+def pares_cercanos(cajas1, cajas2, forma_frame, umbral):
+    """Pares (i, j, distancia) con distancia menor a `umbral` metros"""
+    distancias = calcular_distancias_matriz(cajas1, cajas2, forma_frame)
+    filas, columnas = np.nonzero(distancias < umbral)
+    return [(int(i), int(j), float(distancias[i, j])) for i, j in zip(filas, columnas)]
+
+
+def personas_cerca_de_armas(personas, armas, forma_frame, umbral):
+    """
+    Personas a menos de `umbral` metros de quien porta un arma.
+    El portador es la persona cuya caja contiene el centro del arma; la
+    distancia se mide entre personas porque el modelo asume su altura (1.7 m).
+    Devuelve (portador, persona, distancia) con índices sobre `personas`.
+    """
+    p = np.asarray(personas, dtype=np.float64).reshape(-1, 4)
+    a = np.asarray(armas, dtype=np.float64).reshape(-1, 4)
+    if len(p) < 2 or len(a) == 0:
+        return []
+
+    cx = (a[:, 0] + a[:, 2]) / 2
+    cy = (a[:, 1] + a[:, 3]) / 2
+    contiene = ((p[:, 0, None] <= cx) & (cx <= p[:, 2, None]) &
+                (p[:, 1, None] <= cy) & (cy <= p[:, 3, None]))
+    portadores = np.nonzero(contiene.any(axis=1))[0]
+    if len(portadores) == 0:
+        return []
+
+    distancias = calcular_distancias_matriz(p[portadores], p, forma_frame)
+    distancias[np.arange(len(portadores)), portadores] = np.inf  # excluir al propio portador
+    filas, columnas = np.nonzero(distancias < umbral)
+    return [(int(portadores[i]), int(j), float(distancias[i, j])) for i, j in zip(filas, columnas)]
@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+from datetime import datetime
+
+import requests
+
+# Configura logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuración (usar variables de entorno)
+KUNTUR_API_URL = os.getenv("KUNTUR_API_URL", "http://localhost:8000")
+EVENTOS_MAX_COLA = int(os.getenv("EVENTOS_MAX_COLA", 100))
+EVENTOS_MAX_SUSCRIPTORES = int(os.getenv("EVENTOS_MAX_SUSCRIPTORES", 10000))
+EVENTOS_SECRETO = os.getenv("EVENTOS_SECRETO", "")  # Compartido por main.py, local_processor.py y operadores
+
+# Cabecera con el secreto compartido y cookie de sesión de la cámara
+CABECERA_SECRETO = "X-Kuntur-Secreto"
+COOKIE_SESION = "kuntur_sesion"
+
+# Sin secreto configurado las sesiones se firman con una clave que dura lo que el proceso
+_clave_sesion = (EVENTOS_SECRETO or secrets.token_hex(32)).encode("utf-8")
+
+# Canal al que llegan todos los eventos (operadores / UPC)
+CANAL_TODOS = "todos"
+
+
+class BrokerEventos:
+    """
+    Reparte eventos a las conexiones abiertas de cada canal (usuario o unidad).
+    Cada suscriptor tiene una cola acotada: si un cliente lento la llena se
+    descarta su evento más antiguo, así nunca se bloquea al que publica y la
+    memoria por conexión inactiva se mantiene fija.
+    Debe usarse desde el event loop de FastAPI.
+    """
+
+    def __init__(self, max_cola=EVENTOS_MAX_COLA, max_suscriptores=EVENTOS_MAX_SUSCRIPTORES):
+        self.max_cola = max_cola
+        self.max_suscriptores = max_suscriptores
+        self.canales = {}
+        self.total = 0
+
+    def suscribir(self, canal):
+        """Devuelve la cola del nuevo suscriptor o None si se alcanzó el límite"""
+        if self.total >= self.max_suscriptores:
+            return None
+        cola = asyncio.Queue(maxsize=self.max_cola)
+        self.canales.setdefault(canal, set()).add(cola)
+        self.total += 1
+        return cola
+
+    def desuscribir(self, canal, cola):
+        suscriptores = self.canales.get(canal)
+        if not suscriptores or cola not in suscriptores:
+            return
+        suscriptores.discard(cola)
+        self.total -= 1
+        if not suscriptores:
+            del self.canales[canal]
+
+    def publicar(self, tipo, datos, canales=()):
+        """Publica un evento en los canales indicados y en el canal general"""
+        evento = {
+            "tipo": tipo,
+            "fecha": datetime.now().isoformat(),
+            "datos": datos
+        }
+
+        entregados = 0
+        for canal in {*(c for c in canales if c), CANAL_TODOS}:
+            for cola in self.canales.get(canal, ()):
+                if cola.full():
+                    cola.get_nowait()
+                cola.put_nowait(evento)
+                entregados += 1
+        return entregados
+
+
+def secreto_valido(valor):
+    """True si `valor` es el secreto compartido (nunca si no hay uno configurado)"""
+    return bool(EVENTOS_SECRETO) and hmac.compare_digest((valor or "").encode("utf-8"),
+                                                        EVENTOS_SECRETO.encode("utf-8"))
+
+
+def firmar_sesion(usuario):
+    """Valor de la cookie de sesión que identifica al usuario ante /eventos"""
+    firma = hmac.new(_clave_sesion, usuario.encode("utf-8"), hashlib.sha256).hexdigest()
+    return f"{firma}:{usuario}"
+
+
+def usuario_de_sesion(valor):
+    """Usuario de una cookie de sesión o None si falta o la firma no coincide"""
+    firma, _, usuario = (valor or "").partition(":")
+    if not usuario:
+        return None
+    esperada = hmac.new(_clave_sesion, usuario.encode("utf-8"), hashlib.sha256).hexdigest()
+    return usuario if hmac.compare_digest(firma, esperada) else None
+
+
+async def flujo_sse(broker, canal, cola, intervalo_ping=15):
+    """Generador Server-Sent Events para una suscripción"""
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), timeout=intervalo_ping)
+            except asyncio.TimeoutError:
+                # Comentario SSE para mantener viva la conexión a través de proxies
+                yield ": ping\n\n"
+                continue
+            yield f"event: {evento['tipo']}\ndata: {json.dumps(evento, default=str)}\n\n"
+    finally:
+        broker.desuscribir(canal, cola)
+
+
+def notificar_evento(tipo, datos, canales=()):
+    """Publica un evento en el servidor FastAPI (usado por local_processor)"""
+    try:
+        response = requests.post(
+            f"{KUNTUR_API_URL}/eventos",
+            json={"tipo": tipo, "datos": datos, "canales": list(canales)},
+            headers={CABECERA_SECRETO: EVENTOS_SECRETO} if EVENTOS_SECRETO else None,
+            timeout=5
+        )
+        if response.status_code != 200:
+            logger.error(f"Error publicando evento {tipo}: {response.status_code} - {response.text}")
+            return False
+        return True
+    except Exception as e:
+        logger.error(f"Excepción publicando evento {tipo}: {e}")
+        return False
@@ -0,0 +1,169 @@
+import logging
+import os
+import subprocess
+
+import cv2
+
+from utils.metricas import medir
+
+# Configura logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuración (usar variables de entorno)
+H264_PRESET = os.getenv("H264_PRESET", "veryfast")
+H264_CRF = os.getenv("H264_CRF", "23")
+
+
+def remux_video(entrada, salida):
+    """Copia el bitstream original a un MP4 (sin recodificar) listo para streaming"""
+    try:
+        cmd = [
+            "ffmpeg",
+            "-i", entrada,
+            "-map", "0",
+            "-c", "copy",
+            "-movflags", "+faststart",
+            "-y",
+            salida
+        ]
+        with medir("ffmpeg_remux"):
+            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return True
+    except Exception as e:
+        logger.error(f"Error haciendo remux de {entrada}: {e}")
+        if os.path.exists(salida):
+            os.remove(salida)
+        return False
+
+
+def keyframe_anterior(entrada, segundos):
+    """Tiempo del último keyframe de video en o antes de `segundos` (None si ffprobe falla)"""
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-skip_frame", "nokey",
+        "-show_entries", "frame=pts_time",
+        "-of", "csv=p=0",
+        "-read_intervals", f"{max(0.0, segundos - 30):.3f}%{segundos + 0.001:.3f}",
+        entrada
+    ]
+    try:
+        salida = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True).stdout
+    except Exception as e:
+        logger.error(f"Error buscando keyframes de {entrada}: {e}")
+        return None
+
+    tiempos = []
+    for linea in salida.split():
+        try:
+            tiempos.append(float(linea.strip(",")))
+        except ValueError:
+            continue
+    anteriores = [t for t in tiempos if t <= segundos + 0.001]
+    return max(anteriores) if anteriores else None
+
+
+def recortar_clip(entrada, salida, inicio, fin):
+    """
+    Corta hasta `fin` segundos y devuelve dónde empieza realmente el clip (None si falla).
+    Sin recodificar el corte solo puede empezar en un keyframe, así que se busca el
+    keyframe anterior a `inicio` y se corta desde ahí: el clip nunca pierde el comienzo
+    del incidente y quien lo use (sidecars, ventanas) conoce su tiempo real. Si no hay
+    keyframe conocido o la copia falla se recodifica desde `inicio` exacto.
+    """
+    intentos = []
+    keyframe = keyframe_anterior(entrada, inicio)
+    if keyframe is not None:
+        intentos.append((keyframe, ["-c", "copy", "-avoid_negative_ts", "make_zero"]))
+    intentos.append((inicio, ["-c:v", "libx264", "-preset", H264_PRESET, "-crf", H264_CRF, "-c:a", "aac"]))
+
+    for desde, opciones in intentos:
+        try:
+            cmd = (["ffmpeg", "-ss", f"{desde:.3f}", "-i", entrada, "-t", f"{fin - desde:.3f}", "-map", "0"]
+                   + opciones + ["-movflags", "+faststart", "-y", salida])
+            with medir("ffmpeg_recorte"):
+                subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            if os.path.getsize(salida) > 0:
+                return desde
+        except Exception as e:
+            logger.error(f"Error recortando {entrada} ({desde:.1f}-{fin:.1f}s): {e}")
+    return None
+
+
+class EscritorH264:
+    """
+    Escribe frames BGR en un MP4 H.264 a través de un pipe a ffmpeg.
+    Misma interfaz que cv2.VideoWriter (write/release); si ffmpeg no está
+    disponible usa cv2.VideoWriter con mp4v. Si ffmpeg muere a mitad del video
+    (pipe roto) se cierra, se ignoran los frames siguientes y release() devuelve
+    False para que quien lo usa descarte la salida.
+    """
+
+    def __init__(self, salida, fps, tamano):
+        ancho, alto = tamano
+        self.proceso = None
+        self.respaldo = None
+        self.fallido = False
+        cmd = [
+            "ffmpeg",
+            "-f", "rawvideo",
+            "-pix_fmt", "bgr24",
+            "-s", f"{ancho}x{alto}",
+            "-r", str(fps if fps > 0 else 10),
+            "-i", "-",
+            "-an",
+            "-c:v", "libx264",
+            "-preset", H264_PRESET,
+            "-crf", H264_CRF,
+            "-g", str(max(1, int(2 * fps))),  # Keyframe cada ~2 s para poder recortar sin recodificar
+            "-pix_fmt", "yuv420p",
+            "-movflags", "+faststart",
+            "-y",
+            salida
+        ]
+        try:
+            self.proceso = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except Exception as e:
+            logger.error(f"ffmpeg no disponible, usando mp4v: {e}")
+            self.respaldo = cv2.VideoWriter(salida, cv2.VideoWriter_fourcc(*'mp4v'), fps, tamano)
+
+    def write(self, frame):
+        if self.fallido:
+            return
+        if self.proceso is not None:
+            try:
+                self.proceso.stdin.write(frame.tobytes())
+            except OSError as e:
+                # BrokenPipeError: ffmpeg terminó (disco lleno, parámetros inválidos...)
+                logger.error(f"ffmpeg cerró el pipe ({e}), se descarta el video anotado")
+                self.fallido = True
+                self._cerrar_pipe()
+                self.proceso.kill()
+                self.proceso.wait()
+        else:
+            self.respaldo.write(frame)
+
+    def _cerrar_pipe(self):
+        try:
+            self.proceso.stdin.close()
+        except OSError:
+            pass
+
+    def release(self):
+        """True si el video quedó completo"""
+        if self.fallido:
+            return False
+        if self.proceso is not None:
+            self._cerrar_pipe()
+            if self.proceso.wait() != 0:
+                logger.error(f"ffmpeg terminó con código {self.proceso.returncode}")
+                return False
+            return True
+        self.respaldo.release()
+        return True
@@ -0,0 +1,235 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, GEOSPHERE
+
+# Configura logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuración (usar variables de entorno)
+GEO_PRECISION = int(os.getenv("GEO_PRECISION", 7))  # Caracteres del geohash guardado (~150 m)
+GEO_RADIO_MAX = float(os.getenv("GEO_RADIO_MAX", 50000))  # Radio máximo de búsqueda (m)
+GEO_HOTSPOTS_TTL = float(os.getenv("GEO_HOTSPOTS_TTL", 60))  # Segundos que se reutiliza una agregación
+GEO_UBICACION_EDAD = float(os.getenv("GEO_UBICACION_EDAD", 600))  # Vigencia de la posición enviada por la cámara
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def codificar_geohash(lat, lon, precision=GEO_PRECISION):
+    """Geohash estándar: los prefijos comunes agrupan puntos cercanos"""
+    rango_lat, rango_lon = [-90.0, 90.0], [-180.0, 180.0]
+    resultado = []
+    bits = valor = 0
+    par = True
+    while len(resultado) < precision:
+        rango, coordenada = (rango_lon, lon) if par else (rango_lat, lat)
+        medio = (rango[0] + rango[1]) / 2
+        valor <<= 1
+        if coordenada >= medio:
+            valor |= 1
+            rango[0] = medio
+        else:
+            rango[1] = medio
+        par = not par
+        bits += 1
+        if bits == 5:
+            resultado.append(_BASE32[valor])
+            bits = valor = 0
+    return "".join(resultado)
+
+
+def es_geohash(texto):
+    return all(c in _BASE32 for c in texto)
+
+
+def punto_geojson(ubicacion):
+    """
+    GeoJSON Point [lon, lat] a partir de {"latitud", "longitud"}, {"lat", "lng"/"lon"}
+    o un Point existente. None si falta, está fuera de rango o es 0,0 (ubicación desconocida).
+    """
+    if not isinstance(ubicacion, dict):
+        return None
+    try:
+        if ubicacion.get("type") == "Point":
+            lon, lat = map(float, ubicacion["coordinates"][:2])
+        elif "latitud" in ubicacion:
+            lat, lon = float(ubicacion["latitud"]), float(ubicacion["longitud"])
+        else:
+            lat = float(ubicacion["lat"])
+            lon = float(ubicacion.get("lng", ubicacion.get("lon")))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or (lat == 0 and lon == 0):
+        return None
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+def normalizar_ubicacion(documento):
+    """Deja `ubicacion` como GeoJSON (o la quita) y agrega su geohash"""
+    punto = punto_geojson(documento.get("ubicacion"))
+    if punto is None:
+        documento.pop("ubicacion", None)
+        documento.pop("geohash", None)
+    else:
+        documento["ubicacion"] = punto
+        documento["geohash"] = codificar_geohash(punto["coordinates"][1], punto["coordinates"][0])
+    return documento
+
+
+_indices_listos = set()
+_indices_lock = threading.Lock()
+
+
+def asegurar_indices(coleccion):
+    """
+    Convierte las ubicaciones antiguas ({"latitud", "longitud"}) y crea los índices
+    2dsphere y de geohash. Una vez por colección y proceso.
+    """
+    with _indices_lock:
+        if coleccion.full_name in _indices_listos:
+            return
+
+        migradas = 0
+        for documento in coleccion.find({"ubicacion": {"$exists": True}, "ubicacion.type": {"$exists": False}},
+                                        {"ubicacion": 1}):
+            normalizar_ubicacion(documento)
+            if "ubicacion" in documento:
+                cambios = {"$set": {"ubicacion": documento["ubicacion"], "geohash": documento["geohash"]}}
+            else:
+                cambios = {"$unset": {"ubicacion": "", "geohash": ""}}
+            coleccion.update_one({"_id": documento["_id"]}, cambios)
+            migradas += 1
+        if migradas:
+            logger.info(f"{coleccion.full_name}: {migradas} ubicaciones convertidas a GeoJSON")
+
+        coleccion.create_index([("ubicacion", GEOSPHERE), ("fecha", ASCENDING)])
+        coleccion.create_index([("geohash", ASCENDING), ("fecha", ASCENDING)])
+        _indices_listos.add(coleccion.full_name)
+
+
+def desde_horas(horas):
+    """Límite inferior de `fecha` (ISO, como la guardan los documentos)"""
+    return (datetime.now() - timedelta(hours=horas)).isoformat()
+
+
+def incidentes_cercanos(coleccion, lat, lon, radio, horas, limite=50):
+    """Evidencias a menos de `radio` metros en las últimas `horas`, de la más cercana a la más lejana"""
+    asegurar_indices(coleccion)
+    pipeline = [
+        {"$geoNear": {
+            "near": {"type": "Point", "coordinates": [lon, lat]},
+            "key": "ubicacion",
+            "distanceField": "distancia_m",
+            "maxDistance": min(radio, GEO_RADIO_MAX),
+            "query": {"fecha": {"$gte": desde_horas(horas)}},
+            "spherical": True
+        }},
+        {"$limit": limite},
+        {"$project": {"usuario": 1, "fecha": 1, "descripcion": 1, "url_evidencia": 1,
+                      "estado": 1, "ubicacion": 1, "geohash": 1, "distancia_m": 1}}
+    ]
+    incidentes = list(coleccion.aggregate(pipeline))
+    for incidente in incidentes:
+        incidente["id"] = str(incidente.pop("_id"))
+        incidente["distancia_m"] = round(incidente["distancia_m"], 1)
+    return incidentes
+
+
+def agregar_hotspots(coleccion, horas, precision, prefijo="", limite=200):
+    """Cantidad de evidencias por celda de geohash (`precision` caracteres) en las últimas `horas`"""
+    asegurar_indices(coleccion)
+    filtro = {"fecha": {"$gte": desde_horas(horas)}, "geohash": {"$exists": True}}
+    if prefijo:
+        if not es_geohash(prefijo):
+            raise ValueError(f"Prefijo de geohash inválido: {prefijo}")
+        # Prefijo anclado: usa el índice de geohash
+        filtro["geohash"] = {"$regex": f"^{prefijo}"}
+    pipeline = [
+        {"$match": filtro},
+        {"$group": {
+            "_id": {"$substrCP": ["$geohash", 0, precision]},
+            "incidentes": {"$sum": 1},
+            "lon": {"$avg": {"$arrayElemAt": ["$ubicacion.coordinates", 0]}},
+            "lat": {"$avg": {"$arrayElemAt": ["$ubicacion.coordinates", 1]}},
+            "ultimo": {"$max": "$fecha"}
+        }},
+        {"$sort": {"incidentes": -1}},
+        {"$limit": limite}
+    ]
+    return [
+        {"geohash": c["_id"], "incidentes": c["incidentes"], "centro": [c["lon"], c["lat"]], "ultimo": c["ultimo"]}
+        for c in coleccion.aggregate(pipeline)
+    ]
+
+
+class CacheTTL:
+    """Resultados recientes por clave; evita repetir la agregación en cada refresco del tablero"""
+
+    def __init__(self, ttl=GEO_HOTSPOTS_TTL, max_entradas=256):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.entradas = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, calcular):
+        ahora = time.time()
+        with self._lock:
+            entrada = self.entradas.get(clave)
+            if entrada is not None and entrada[0] > ahora:
+                return entrada[1]
+
+        valor = calcular()
+        with self._lock:
+            if len(self.entradas) >= self.max_entradas:
+                for vencida in [c for c, (expira, _) in self.entradas.items() if expira <= ahora]:
+                    del self.entradas[vencida]
+            if len(self.entradas) >= self.max_entradas:
+                del self.entradas[next(iter(self.entradas))]
+            self.entradas[clave] = (ahora + self.ttl, valor)
+        return valor
+
+
+def registrar_ubicacion(coleccion, usuario, lat, lon):
+    """Última posición conocida de la cámara (la envía el navegador con cada segmento)"""
+    punto = punto_geojson({"lat": lat, "lon": lon})
+    if punto is None:
+        return False
+    coleccion.update_one(
+        {"usuario": usuario},
+        {"$set": {"ubicacion": punto, "actualizado": time.time()}},
+        upsert=True
+    )
+    return True
+
+
+def sufijo_ubicacion(lat, lon):
+    """Sufijo @lat_lon del nombre de un segmento (vacío si no hay una posición válida)"""
+    if lat is None or lon is None or punto_geojson({"lat": lat, "lon": lon}) is None:
+        return ""
+    return f"@{float(lat):.6f}_{float(lon):.6f}"
+
+
+def ubicacion_de_archivo(ruta):
+    """
+    GeoJSON de la posición en que se grabó el segmento (usuario@timestamp@lat_lon.mp4).
+    El nombre viaja con el clip por la cola y B2; None si no la trae.
+    """
+    partes = os.path.splitext(os.path.basename(ruta))[0].split("@")
+    if len(partes) < 3:
+        return None
+    lat, _, lon = partes[2].partition("_")
+    return punto_geojson({"lat": lat, "lon": lon})
+
+
+def ultima_ubicacion(coleccion, usuario, max_edad=GEO_UBICACION_EDAD):
+    """GeoJSON de la última posición de la cámara si es reciente, si no None"""
+    documento = coleccion.find_one({"usuario": usuario, "actualizado": {"$gte": time.time() - max_edad}})
+    return documento["ubicacion"] if documento else None
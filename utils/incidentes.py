@@ -0,0 +1,152 @@
+import json
+import os
+from array import array
+
+# Configuración (usar variables de entorno)
+INCIDENTE_SEPARACION = float(os.getenv("INCIDENTE_SEPARACION", 3))  # Segundos sin detección que cierran un incidente
+EVIDENCIA_PRE_ROLL = float(os.getenv("EVIDENCIA_PRE_ROLL", 3))  # Segundos antes del incidente en el clip
+EVIDENCIA_POST_ROLL = float(os.getenv("EVIDENCIA_POST_ROLL", 3))  # Segundos después del incidente en el clip
+
+
+class LineaTiempo:
+    """
+    Detecciones de un video guardadas en arrays compactos (frame, track, caja,
+    confianza) en lugar de un dict por frame. Las detecciones se agrupan en
+    incidentes a medida que llegan: una detección a más de `separacion`
+    segundos de la anterior abre un incidente nuevo.
+    """
+
+    def __init__(self, fps, separacion=INCIDENTE_SEPARACION):
+        self.fps = fps if fps > 0 else 1
+        self.separacion_frames = separacion * self.fps
+        self.frames = array('l')
+        self.tracks = array('l')
+        self.cajas = array('f')  # x1, y1, x2, y2 consecutivos
+        self.confs = array('f')
+        self._incidentes = []  # [indice_inicio, indice_fin, indice_mejor]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def agregar(self, frame, track_id, caja, conf):
+        """Agrega una detección y devuelve (incidente, es_mejor_deteccion)"""
+        indice = len(self.frames)
+        self.frames.append(frame)
+        self.tracks.append(track_id)
+        self.cajas.extend(caja)
+        self.confs.append(conf)
+
+        actual = self._incidentes[-1] if self._incidentes else None
+        if actual is None or frame - self.frames[actual[1]] > self.separacion_frames:
+            self._incidentes.append([indice, indice, indice])
+            return len(self._incidentes) - 1, True
+
+        actual[1] = indice
+        if conf > self.confs[actual[2]]:
+            actual[2] = indice
+            return len(self._incidentes) - 1, True
+        return len(self._incidentes) - 1, False
+
+    @classmethod
+    def cargar_json(cls, ruta):
+        """Reconstruye la línea de tiempo desde su sidecar JSON; devuelve (linea, ancho, alto)"""
+        with open(ruta) as f:
+            datos = json.load(f)
+        linea = cls(datos["fps"])
+        detecciones = datos["detecciones"]
+        for i, frame in enumerate(detecciones["frame"]):
+            linea.agregar(frame, detecciones["track"][i], detecciones["caja"][i * 4:i * 4 + 4],
+                          detecciones["confianza"][i])
+        return linea, datos["ancho"], datos["alto"]
+
+    def recortar(self, inicio, fin):
+        """Detecciones entre `inicio` y `fin` segundos, con los frames relativos a `inicio`"""
+        desfase = round(inicio * self.fps)
+        recorte = LineaTiempo(self.fps, self.separacion_frames / self.fps)
+        for i, frame in enumerate(self.frames):
+            if desfase <= frame <= fin * self.fps:
+                recorte.agregar(frame - desfase, self.tracks[i], self.cajas[i * 4:i * 4 + 4], self.confs[i])
+        return recorte
+
+    def caja(self, indice):
+        return [int(v) for v in self.cajas[indice * 4:indice * 4 + 4]]
+
+    def incidentes(self, tipo="armaDetectada"):
+        """Resumen de cada incidente: inicio/fin, confianza máxima y mejor frame"""
+        resumen = []
+        for inicio, fin, mejor in self._incidentes:
+            tracks = sorted({t for t in self.tracks[inicio:fin + 1] if t >= 0})
+            resumen.append({
+                "tipo": tipo,
+                "tiempo": self.frames[inicio] / self.fps,
+                "inicio": self.frames[inicio] / self.fps,
+                "fin": self.frames[fin] / self.fps,
+                "confianza": round(float(self.confs[mejor]), 4),
+                "mejor_frame": self.frames[mejor],
+                "caja": self.caja(mejor),
+                "tracks": tracks,
+                "detecciones": fin - inicio + 1
+            })
+        return resumen
+
+    def guardar_json(self, ruta, ancho, alto, tipo="armaDetectada"):
+        """Sidecar JSON con las detecciones en columnas (para superponer en el visor)"""
+        datos = {
+            "fps": self.fps,
+            "ancho": ancho,
+            "alto": alto,
+            "incidentes": self.incidentes(tipo),
+            "detecciones": {
+                "frame": self.frames.tolist(),
+                "track": self.tracks.tolist(),
+                "caja": [int(v) for v in self.cajas],
+                "confianza": [round(c, 3) for c in self.confs.tolist()]
+            }
+        }
+        with open(ruta, "w") as f:
+            json.dump(datos, f, separators=(",", ":"))
+        return ruta
+
+    def guardar_webvtt(self, ruta, duracion_maxima=0.5):
+        """Sidecar WebVTT (pista de metadatos): un cue con las cajas de cada frame inferido"""
+        por_frame = {}
+        for i, frame in enumerate(self.frames):
+            x1, y1, x2, y2 = self.caja(i)
+            por_frame.setdefault(frame, []).append({
+                "caja": [x1, y1, x2, y2],
+                "conf": round(float(self.confs[i]), 3),
+                "track": self.tracks[i]
+            })
+
+        frames = sorted(por_frame)
+        with open(ruta, "w") as f:
+            f.write("WEBVTT\n\n")
+            for n, frame in enumerate(frames):
+                inicio = frame / self.fps
+                fin = inicio + duracion_maxima
+                if n + 1 < len(frames):
+                    fin = min(fin, frames[n + 1] / self.fps)
+                f.write(f"{formato_vtt(inicio)} --> {formato_vtt(fin)}\n")
+                f.write(json.dumps(por_frame[frame], separators=(",", ":")) + "\n\n")
+        return ruta
+
+
+def formato_vtt(segundos):
+    horas, resto = divmod(segundos, 3600)
+    minutos, segundos = divmod(resto, 60)
+    return f"{int(horas):02d}:{int(minutos):02d}:{segundos:06.3f}"
+
+
+def ventanas_evidencia(incidentes, duracion, pre_roll=EVIDENCIA_PRE_ROLL, post_roll=EVIDENCIA_POST_ROLL):
+    """Ventanas [inicio, fin] alrededor de cada incidente, unidas si se solapan"""
+    ventanas = []
+    for incidente in sorted(incidentes, key=lambda i: i["inicio"]):
+        inicio = max(0.0, incidente["inicio"] - pre_roll)
+        fin = incidente["fin"] + post_roll
+        if duracion > 0:
+            fin = min(fin, duracion)
+        if ventanas and inicio <= ventanas[-1][1]:
+            ventanas[-1][1] = max(ventanas[-1][1], fin)
+        else:
+            ventanas.append([inicio, fin])
+    return [(round(i, 3), round(f, 3)) for i, f in ventanas]
@@ -0,0 +1,164 @@
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from utils.video_processing import MODEL_ARMAS, cargar_modelo_seguro, detectar_armas
+from utils.movimiento import DetectorMovimiento, MuestreoAdaptativo
+from utils.cola_trabajos import MODO_COLA, encolar_trabajo
+
+# Configura logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuración de la ingesta en vivo (usar variables de entorno)
+WS_MUESTREO = int(os.getenv("WS_MUESTREO", 2))  # Paso base de detección (frames recibidos)
+WS_MUESTREO_MAX = int(os.getenv("WS_MUESTREO_MAX", 20))  # Paso máximo con la escena quieta
+WS_PRE_ROLL = float(os.getenv("WS_PRE_ROLL", 5))  # Segundos antes de la alerta
+WS_POST_ROLL = float(os.getenv("WS_POST_ROLL", 5))  # Segundos después de la alerta
+WS_CLIP_MAX = float(os.getenv("WS_CLIP_MAX", 60))  # Duración máxima de un clip; si el arma sigue se corta otro
+WS_MAX_FRAME_BYTES = int(os.getenv("WS_MAX_FRAME_BYTES", 512 * 1024))
+
+# Los clips de evidencia se dejan en la carpeta vigilada por local_processor.py
+CARPETA_VIDEOS = os.path.join("data", "videos")
+
+# Sufijo del nombre (usuario@timestamp@vivo.mp4) que distingue los clips en vivo de los segmentos
+MARCA_VIVO = "vivo"
+
+
+def es_clip_vivo(ruta):
+    """True si el video es un clip de evidencia de la ingesta WebSocket"""
+    return os.path.splitext(os.path.basename(ruta))[0].endswith(f"@{MARCA_VIVO}")
+
+
+class SesionIngesta:
+    """
+    Estado de una cámara conectada por WebSocket.
+    Cada sesión tiene su propia instancia del modelo para que el tracker
+    (persist=True) no mezcle objetos de cámaras distintas, y un buffer
+    circular de frames JPEG para poder cortar clips alrededor de una alerta.
+    """
+
+    def __init__(self, usuario):
+        self.usuario = usuario
+        self.modelo = None
+        self.buffer = deque()  # (timestamp, jpeg)
+        self.frames_recibidos = 0
+        self.movimiento = DetectorMovimiento()
+        self.muestreo = MuestreoAdaptativo(WS_MUESTREO, WS_MUESTREO_MAX)
+        self.ultimo_movimiento = True
+        self.clip_desde = None
+        self.clip_hasta = None
+        self._lock = threading.Lock()
+
+    def cargar_modelo(self):
+        self.modelo = cargar_modelo_seguro(MODEL_ARMAS)
+
+    def agregar_frame(self, datos, ahora):
+        """Guarda el frame en el buffer y devuelve True si toca ejecutar detección"""
+        if len(datos) > WS_MAX_FRAME_BYTES:
+            logger.warning(f"Frame descartado de {self.usuario}: {len(datos)} bytes")
+            return False
+
+        with self._lock:
+            self.buffer.append((ahora, datos))
+            self.frames_recibidos += 1
+
+            # Mantener solo lo necesario para el pre-roll (o el clip en curso)
+            limite = ahora - WS_PRE_ROLL
+            if self.clip_desde is not None:
+                limite = min(limite, self.clip_desde)
+            while self.buffer and self.buffer[0][0] < limite:
+                self.buffer.popleft()
+
+        # Decodificación reducida (1/8, gris): mucho más barata que el frame completo
+        reducido = cv2.imdecode(np.frombuffer(datos, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if reducido is None:
+            return False
+        movimiento = self.movimiento.hay_movimiento(reducido)
+
+        # muestreo también lo actualiza detectar() desde el hilo de asyncio.to_thread
+        with self._lock:
+            self.ultimo_movimiento = movimiento
+            return self.muestreo.debe_inferir(movimiento)
+
+    def detectar(self, datos):
+        """Decodifica el JPEG y ejecuta el modelo de armas de la sesión"""
+        frame = cv2.imdecode(np.frombuffer(datos, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return []
+        armas = detectar_armas(self.modelo, frame)
+        with self._lock:
+            self.muestreo.registrar(armas, self.ultimo_movimiento)
+        return armas
+
+    def programar_clip(self, ahora):
+        """Extiende la ventana del clip de evidencia alrededor de una alerta"""
+        with self._lock:
+            if self.clip_desde is None:
+                self.clip_desde = ahora - WS_PRE_ROLL
+            self.clip_hasta = ahora + WS_POST_ROLL
+
+    def clip_listo(self, ahora):
+        """Terminó el post-roll o el clip llegó a WS_CLIP_MAX (el buffer no crece sin límite)"""
+        if self.clip_hasta is None:
+            return False
+        return ahora >= self.clip_hasta or ahora - self.clip_desde >= WS_CLIP_MAX
+
+    def extraer_clip(self):
+        """Saca del buffer los frames de la ventana de evidencia y la reinicia"""
+        with self._lock:
+            if self.clip_desde is None:
+                return []
+            frames = [(t, d) for t, d in self.buffer if self.clip_desde <= t <= self.clip_hasta]
+            self.clip_desde = None
+            self.clip_hasta = None
+        return frames
+
+    def guardar_clip(self, frames):
+        """Escribe los frames del clip como video para que lo procese local_processor"""
+        if len(frames) < 2:
+            return None
+
+        duracion = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / duracion if duracion > 0 else 10
+
+        primero = cv2.imdecode(np.frombuffer(frames[0][1], dtype=np.uint8), cv2.IMREAD_COLOR)
+        if primero is None:
+            return None
+        height, width = primero.shape[:2]
+
+        os.makedirs(CARPETA_VIDEOS, exist_ok=True)
+        # Marca con el último frame, igual que /upload-video (hora de fin del segmento)
+        timestamp = datetime.fromtimestamp(frames[-1][0]).strftime("%Y%m%d_%H%M%S_%f")
+        clip_path = os.path.join(CARPETA_VIDEOS, f"{self.usuario}@{timestamp}@{MARCA_VIVO}.mp4")
+
+        out = cv2.VideoWriter(clip_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+        for _, datos in frames:
+            frame = cv2.imdecode(np.frombuffer(datos, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                continue
+            if frame.shape[:2] != (height, width):
+                frame = cv2.resize(frame, (width, height))
+            out.write(frame)
+        out.release()
+
+        logger.info(f"Clip de evidencia guardado: {clip_path} ({len(frames)} frames, {duracion:.1f}s)")
+        if MODO_COLA == "mongo":
+            encolar_trabajo(clip_path, self.usuario, prioridad=1)
+        return clip_path
+
+    def cerrar(self):
+        """Guarda el clip pendiente si la cámara se desconecta durante una alerta"""
+        frames = self.extraer_clip()
+        if frames:
+            self.guardar_clip(frames)
+        self.buffer.clear()
+        self.modelo = None
@@ -0,0 +1,202 @@
+import contextvars
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configura logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuración (usar variables de entorno)
+PUERTO_METRICAS = int(os.getenv("PUERTO_METRICAS", 9100))  # Servidor /metrics de local_processor.py
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BUCKETS_FPS = (1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 240)
+
+# Trace del clip que se está procesando (se propaga a asyncio.to_thread)
+trace_actual = contextvars.ContextVar("trace_actual", default="")
+
+
+def _formato_labels(nombres, valores, extra=()):
+    pares = list(zip(nombres, valores)) + list(extra)
+    if not pares:
+        return ""
+    texto = ",".join(f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for n, v in pares)
+    return "{" + texto + "}"
+
+
+class Metrica:
+    tipo = ""
+
+    def __init__(self, nombre, ayuda, labels=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.labels = tuple(labels)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _clave(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def exposicion(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        with self._lock:
+            for clave, valor in sorted(self._valores.items()):
+                lineas.extend(self._lineas(clave, valor))
+        return lineas
+
+    def _lineas(self, clave, valor):
+        return [f"{self.nombre}{_formato_labels(self.labels, clave)} {valor:g}"]
+
+
+class Contador(Metrica):
+    tipo = "counter"
+
+    def inc(self, cantidad=1, **labels):
+        clave = self._clave(labels)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+
+class Gauge(Metrica):
+    tipo = "gauge"
+
+    def set(self, valor, **labels):
+        with self._lock:
+            self._valores[self._clave(labels)] = valor
+
+    def inc(self, cantidad=1, **labels):
+        clave = self._clave(labels)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def dec(self, cantidad=1, **labels):
+        self.inc(-cantidad, **labels)
+
+
+class Histograma(Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, labels=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, valor, **labels):
+        clave = self._clave(labels)
+        with self._lock:
+            estado = self._valores.get(clave)
+            if estado is None:
+                estado = self._valores[clave] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    estado[0][i] += 1
+            estado[1] += valor
+            estado[2] += 1
+
+    def totales(self):
+        """{labels: (suma, conteo)} para comparar antes y después de una prueba"""
+        with self._lock:
+            return {clave: (estado[1], estado[2]) for clave, estado in self._valores.items()}
+
+    def _lineas(self, clave, valor):
+        conteos, suma, total = valor
+        lineas = [
+            f"{self.nombre}_bucket{_formato_labels(self.labels, clave, [('le', f'{limite:g}')])} {conteo}"
+            for limite, conteo in zip(self.buckets, conteos)
+        ]
+        lineas.append(f"{self.nombre}_bucket{_formato_labels(self.labels, clave, [('le', '+Inf')])} {total}")
+        lineas.append(f"{self.nombre}_sum{_formato_labels(self.labels, clave)} {suma:g}")
+        lineas.append(f"{self.nombre}_count{_formato_labels(self.labels, clave)} {total}")
+        return lineas
+
+
+class Registro:
+    """Métricas de un proceso en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self.metricas = []
+
+    def _agregar(self, metrica):
+        self.metricas.append(metrica)
+        return metrica
+
+    def contador(self, nombre, ayuda, labels=()):
+        return self._agregar(Contador(nombre, ayuda, labels))
+
+    def gauge(self, nombre, ayuda, labels=()):
+        return self._agregar(Gauge(nombre, ayuda, labels))
+
+    def histograma(self, nombre, ayuda, labels=(), buckets=BUCKETS_SEGUNDOS):
+        return self._agregar(Histograma(nombre, ayuda, labels, buckets))
+
+    def exposicion(self):
+        lineas = []
+        for metrica in self.metricas:
+            lineas.extend(metrica.exposicion())
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+
+ETAPA_SEGUNDOS = registro.histograma("kuntur_etapa_segundos", "Duración de cada etapa del pipeline", ["etapa"])
+ETAPA_ERRORES = registro.contador("kuntur_etapa_errores_total", "Etapas que terminaron con excepción", ["etapa"])
+CLIPS = registro.contador("kuntur_clips_total", "Clips recibidos o procesados", ["evento"])
+VIDEO_FPS = registro.histograma("kuntur_video_fps", "Frames por segundo al procesar un clip", ["fase"],
+                                buckets=BUCKETS_FPS)
+BYTES = registro.contador("kuntur_bytes_total", "Bytes transferidos", ["destino"])
+THROUGHPUT = registro.histograma("kuntur_throughput_mb_s", "MB/s de subidas y descargas", ["destino"],
+                                 buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100))
+COLA = registro.gauge("kuntur_cola_pendientes", "Elementos esperando en cada cola", ["cola"])
+CONEXIONES = registro.gauge("kuntur_conexiones", "Conexiones abiertas (WebSocket de cámaras, SSE)", ["tipo"])
+
+
+def trace_de_archivo(nombre):
+    """Trace id estable del clip: main.py y local_processor.py lo derivan del nombre del archivo"""
+    return hashlib.sha1(os.path.basename(nombre).encode("utf-8")).hexdigest()[:16]
+
+
+@contextmanager
+def medir(etapa):
+    """Observa la duración de una etapa y la deja en el log con el trace del clip"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ETAPA_ERRORES.inc(etapa=etapa)
+        raise
+    finally:
+        duracion = time.perf_counter() - inicio
+        ETAPA_SEGUNDOS.observe(duracion, etapa=etapa)
+        logger.info(f"[trace {trace_actual.get() or '-'}] {etapa}: {duracion:.3f}s")
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = registro.exposicion().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_servidor_metricas(puerto=PUERTO_METRICAS):
+    """Expone /metrics en un hilo (para procesos sin FastAPI)"""
+    servidor = ThreadingHTTPServer(("0.0.0.0", puerto), _ManejadorMetricas)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    logger.info(f"Métricas disponibles en http://0.0.0.0:{puerto}/metrics")
+    return servidor
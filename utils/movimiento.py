@@ -0,0 +1,75 @@
+import os
+
+import cv2
+import numpy as np
+
+# Configuración (usar variables de entorno)
+MOVIMIENTO_UMBRAL = float(os.getenv("MOVIMIENTO_UMBRAL", 0.01))  # Fracción de píxeles que cambian
+MOVIMIENTO_UMBRAL_PIXEL = int(os.getenv("MOVIMIENTO_UMBRAL_PIXEL", 25))  # Diferencia de gris por píxel
+MUESTREO_BASE = int(os.getenv("MUESTREO_BASE", 6))  # Paso con movimiento y sin detecciones
+MUESTREO_MAX = int(os.getenv("MUESTREO_MAX", 48))  # Paso máximo con la escena quieta
+
+TAMANO_MOVIMIENTO = (64, 36)
+
+
+class DetectorMovimiento:
+    """Compara cada frame reducido a 64x36 en gris con el anterior"""
+
+    def __init__(self, umbral=MOVIMIENTO_UMBRAL, umbral_pixel=MOVIMIENTO_UMBRAL_PIXEL):
+        self.umbral = umbral
+        self.umbral_pixel = umbral_pixel
+        self.anterior = None
+
+    def hay_movimiento(self, frame):
+        """Acepta frames BGR o en gris de cualquier tamaño"""
+        pequeno = cv2.resize(frame, TAMANO_MOVIMIENTO, interpolation=cv2.INTER_AREA)
+        if pequeno.ndim == 3:
+            pequeno = cv2.cvtColor(pequeno, cv2.COLOR_BGR2GRAY)
+
+        anterior, self.anterior = self.anterior, pequeno
+        if anterior is None:
+            return True
+
+        cambiados = np.count_nonzero(cv2.absdiff(pequeno, anterior) > self.umbral_pixel)
+        return cambiados / pequeno.size >= self.umbral
+
+
+class MuestreoAdaptativo:
+    """
+    Decide en qué frames correr YOLO.
+    Con objetos en seguimiento se infiere en cada frame; con movimiento y sin
+    detecciones cada `base` frames; con la escena quieta el paso se duplica
+    tras cada inferencia vacía hasta `maximo`. Un cambio de escena vuelve al
+    paso base de inmediato.
+    """
+
+    def __init__(self, base=MUESTREO_BASE, maximo=MUESTREO_MAX):
+        self.base = base
+        self.maximo = max(maximo, base)
+        self.paso = base
+        self.desde_inferencia = None
+        self.tracks_activos = False
+
+    def debe_inferir(self, movimiento):
+        if self.desde_inferencia is None:
+            self.desde_inferencia = 0
+            return True
+
+        self.desde_inferencia += 1
+        if movimiento and self.paso > self.base:
+            self.paso = self.base
+
+        if self.desde_inferencia >= self.paso:
+            self.desde_inferencia = 0
+            return True
+        return False
+
+    def registrar(self, detecciones, movimiento):
+        """Ajusta el paso según el resultado de la última inferencia"""
+        self.tracks_activos = bool(detecciones)
+        if self.tracks_activos:
+            self.paso = 1
+        elif movimiento:
+            self.paso = self.base
+        else:
+            self.paso = min(self.paso * 2, self.maximo)
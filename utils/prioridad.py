@@ -0,0 +1,88 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+# Configura logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuración (usar variables de entorno)
+PRIORIDAD_SEGUNDOS = float(os.getenv("PRIORIDAD_SEGUNDOS", 300))  # Duración de la prioridad tras un pánico
+
+# Marcas compartidas entre main.py y local_processor.py (procesos distintos)
+CARPETA_PRIORIDAD = os.path.join("data", "prioridad")
+
+
+def _ruta_marca(usuario):
+    """Archivo de la marca: el usuario viene de la petición, se hashea para no armar rutas con él"""
+    return os.path.join(CARPETA_PRIORIDAD, hashlib.sha1(str(usuario).encode("utf-8")).hexdigest())
+
+
+def marcar_prioridad(usuario, segundos=PRIORIDAD_SEGUNDOS):
+    """Marca la cámara de un usuario como prioritaria durante un tiempo"""
+    os.makedirs(CARPETA_PRIORIDAD, exist_ok=True)
+    ruta = _ruta_marca(usuario)
+    with open(ruta, "w") as f:
+        f.write(str(time.time() + segundos))
+    logger.info(f"Cámara de {usuario} marcada como prioritaria por {segundos:.0f}s")
+
+
+def es_prioritario(usuario):
+    """Indica si la cámara del usuario tiene una marca de prioridad vigente"""
+    ruta = _ruta_marca(usuario)
+    try:
+        with open(ruta) as f:
+            return float(f.read().strip() or 0) > time.time()
+    except (OSError, ValueError):
+        return False
+
+
+class ColaPrioridad:
+    """
+    Cola de videos pendientes que atiende primero a las cámaras prioritarias.
+    La prioridad se evalúa al sacar cada elemento (no al encolarlo), así los
+    segmentos que ya esperaban adelantan a los demás apenas llega un pánico.
+    """
+
+    def __init__(self):
+        self._items = []  # (llegada, usuario, ruta)
+        self._cond = threading.Condition()
+
+    def put(self, usuario, ruta):
+        with self._cond:
+            self._items.append((time.time(), usuario, ruta))
+            self._cond.notify()
+
+    def get(self):
+        while True:
+            with self._cond:
+                while not self._items:
+                    self._cond.wait()
+                pendientes = list(self._items)
+
+            # Primera cámara prioritaria en orden de llegada, si no la más antigua.
+            # Las marcas se leen del disco fuera del lock para no frenar a put()
+            prioritarios = {}
+            elegido = pendientes[0]
+            for item in pendientes:
+                usuario = item[1]
+                if usuario not in prioritarios:
+                    prioritarios[usuario] = es_prioritario(usuario)
+                if prioritarios[usuario]:
+                    elegido = item
+                    break
+
+            with self._cond:
+                # Otro consumidor pudo haberlo sacado mientras se leían las marcas
+                if elegido in self._items:
+                    self._items.remove(elegido)
+                    return elegido[1], elegido[2]
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
@@ -0,0 +1,171 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+# Configura logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+
+class Regla:
+    """Límites de un directorio: edad máxima (s), bytes totales y bytes por usuario (0 = sin límite)"""
+
+    def __init__(self, edad=0, max_bytes=0, max_bytes_usuario=0):
+        self.edad = edad
+        self.max_bytes = max_bytes
+        self.max_bytes_usuario = max_bytes_usuario
+
+
+class Archivo:
+    __slots__ = ("directorio", "usuario", "tamano", "mtime", "en_b2")
+
+    def __init__(self, directorio, usuario, tamano, mtime, en_b2=False):
+        self.directorio = directorio
+        self.usuario = usuario
+        self.tamano = tamano
+        self.mtime = mtime
+        self.en_b2 = en_b2
+
+
+def usuario_de_ruta(directorio, ruta):
+    """usuario@timestamp.mp4 en data/videos, usuario/unidad/fecha/... en data/procesados"""
+    relativa = os.path.relpath(ruta, directorio)
+    partes = relativa.split(os.sep)
+    if len(partes) > 1:
+        return partes[0]
+    nombre = partes[0].rsplit('.', 1)[0]
+    return nombre.split("@")[0] if "@" in nombre else "unknown"
+
+
+class GestorRetencion:
+    """
+    Índice en memoria de los archivos de cada directorio administrado, con sus
+    totales por directorio y por usuario. El pipeline avisa altas, bajas y
+    movimientos, así que aplicar las cuotas no necesita volver a listar el
+    disco. Nunca borra archivos en uso (encolados o en proceso en este nodo o
+    en la cola compartida) y, al liberar
+    espacio, borra primero las copias locales ya confirmadas en B2 y luego las
+    más antiguas.
+    """
+
+    def __init__(self, reglas):
+        self.reglas = {os.path.abspath(d): r for d, r in reglas.items()}
+        self.archivos = {}
+        self.totales = Counter()
+        self.totales_usuario = Counter()
+        self.en_uso = Counter()
+        self._lock = threading.Lock()
+
+    def _directorio(self, ruta):
+        for directorio in self.reglas:
+            if ruta.startswith(directorio + os.sep):
+                return directorio
+        return None
+
+    def indexar_inicial(self):
+        """Único recorrido del disco, al arrancar"""
+        for directorio in self.reglas:
+            for raiz, _, nombres in os.walk(directorio):
+                for nombre in nombres:
+                    self.registrar(os.path.join(raiz, nombre))
+        logger.info(f"Retención: {len(self.archivos)} archivos indexados "
+                    f"({sum(self.totales.values()) / GB:.2f} GB)")
+
+    def registrar(self, ruta, en_b2=False):
+        ruta = os.path.abspath(ruta)
+        directorio = self._directorio(ruta)
+        if directorio is None:
+            return
+        try:
+            stat = os.stat(ruta)
+        except OSError:
+            return
+
+        with self._lock:
+            self._quitar(ruta)
+            archivo = Archivo(directorio, usuario_de_ruta(directorio, ruta), stat.st_size, stat.st_mtime, en_b2)
+            self.archivos[ruta] = archivo
+            self.totales[directorio] += archivo.tamano
+            self.totales_usuario[(directorio, archivo.usuario)] += archivo.tamano
+
+    def _quitar(self, ruta):
+        archivo = self.archivos.pop(ruta, None)
+        if archivo is not None:
+            self.totales[archivo.directorio] -= archivo.tamano
+            self.totales_usuario[(archivo.directorio, archivo.usuario)] -= archivo.tamano
+
+    def olvidar(self, ruta):
+        with self._lock:
+            self._quitar(os.path.abspath(ruta))
+
+    def marcar_en_uso(self, ruta):
+        with self._lock:
+            self.en_uso[os.path.abspath(ruta)] += 1
+
+    def liberar(self, ruta):
+        """Fin del uso; si el pipeline ya movió o borró el archivo sale del índice"""
+        ruta = os.path.abspath(ruta)
+        with self._lock:
+            self.en_uso[ruta] -= 1
+            if self.en_uso[ruta] <= 0:
+                del self.en_uso[ruta]
+            if ruta in self.archivos and not os.path.exists(ruta):
+                self._quitar(ruta)
+
+    def _borrar(self, ruta, motivo):
+        try:
+            os.remove(ruta)
+            logger.info(f"Retención ({motivo}): borrado {ruta}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Retención: no se pudo borrar {ruta}: {e}")
+            return
+        self._quitar(ruta)
+
+    def aplicar(self, ahora=None, protegidos=()):
+        """
+        Aplica edad máxima y cuotas de tamaño (por usuario y por directorio).
+        `protegidos`: nombres de archivo que otro proceso todavía necesita
+        (trabajos pendientes o con lease en la cola compartida); no se borran.
+        """
+        ahora = time.time() if ahora is None else ahora
+        protegidos = set(protegidos)
+        with self._lock:
+            for directorio, regla in self.reglas.items():
+                # Candidatos: primero los confirmados en B2, luego los más antiguos
+                candidatos = sorted(
+                    (r for r, a in self.archivos.items()
+                     if a.directorio == directorio and r not in self.en_uso and os.path.basename(r) not in protegidos),
+                    key=lambda r: (not self.archivos[r].en_b2, self.archivos[r].mtime)
+                )
+
+                if regla.edad:
+                    for ruta in candidatos:
+                        if ahora - self.archivos[ruta].mtime > regla.edad:
+                            self._borrar(ruta, "edad")
+                    candidatos = [r for r in candidatos if r in self.archivos]
+
+                if regla.max_bytes_usuario:
+                    for ruta in candidatos:
+                        archivo = self.archivos.get(ruta)
+                        if archivo and self.totales_usuario[(directorio, archivo.usuario)] > regla.max_bytes_usuario:
+                            self._borrar(ruta, f"cuota de {archivo.usuario}")
+                    candidatos = [r for r in candidatos if r in self.archivos]
+
+                if regla.max_bytes:
+                    for ruta in candidatos:
+                        if self.totales[directorio] <= regla.max_bytes:
+                            break
+                        self._borrar(ruta, "cuota del directorio")
+
+                if regla.max_bytes and self.totales[directorio] > regla.max_bytes:
+                    logger.warning(f"Retención: {directorio} sigue sobre la cuota "
+                                   f"({self.totales[directorio] / GB:.2f} GB, archivos en uso)")
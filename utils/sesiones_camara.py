@@ -0,0 +1,84 @@
+import logging
+import os
+import threading
+import time
+
+from utils.incidentes import INCIDENTE_SEPARACION
+from utils.video_processing import MODEL_ARMAS, cargar_modelo_seguro
+
+# Configura logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuración (usar variables de entorno)
+SESION_CONTINUIDAD = float(os.getenv("SESION_CONTINUIDAD", 10))  # Hueco máximo entre segmentos consecutivos (s)
+SESION_INACTIVIDAD = float(os.getenv("SESION_INACTIVIDAD", 600))  # Segundos sin segmentos para cerrar la sesión
+
+
+class SesionCamara:
+    """
+    Estado que una cámara arrastra entre segmentos consecutivos: el modelo (y
+    con él el tracker, persist=True), el fin del último segmento y la evidencia
+    del incidente que seguía abierto al terminarlo.
+    """
+
+    def __init__(self, usuario):
+        self.usuario = usuario
+        self.modelo = None
+        self.fin_ultimo_segmento = None
+        self.id_evidencia = None  # Evidencia del incidente abierto al final del último segmento
+        self.ultimo_uso = time.time()
+
+    def modelo_armas(self):
+        if self.modelo is None:
+            self.modelo = cargar_modelo_seguro(MODEL_ARMAS)
+        return self.modelo
+
+    def es_continuacion(self, resultados):
+        """
+        True si el segmento solo continúa el incidente abierto del anterior: un único
+        incidente que empieza al comienzo del segmento. Si hay otro incidente después,
+        el segmento va como evidencia nueva (descripción, evento y aviso a la UPC propios).
+        """
+        if self.id_evidencia is None or self.fin_ultimo_segmento is None:
+            return False
+        if abs(resultados["inicio_segmento"] - self.fin_ultimo_segmento) > SESION_CONTINUIDAD:
+            return False
+
+        alertas = resultados.get("alertas")
+        return bool(alertas) and len(alertas) == 1 and alertas[0]["inicio"] <= INCIDENTE_SEPARACION
+
+    def cerrar_segmento(self, resultados, id_evidencia=None):
+        """Recuerda el fin del segmento y si su último incidente quedó abierto"""
+        duracion = resultados.get("duracion", 0)
+        self.fin_ultimo_segmento = resultados["inicio_segmento"] + duracion
+        self.ultimo_uso = time.time()
+
+        alertas = resultados.get("alertas")
+        abierto = bool(alertas) and alertas[-1]["fin"] >= duracion - INCIDENTE_SEPARACION
+        self.id_evidencia = id_evidencia if abierto else None
+
+
+class RegistroSesiones:
+    """Sesiones por usuario; las inactivas se descartan para liberar sus modelos"""
+
+    def __init__(self, inactividad=SESION_INACTIVIDAD):
+        self.inactividad = inactividad
+        self.sesiones = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, usuario):
+        with self._lock:
+            ahora = time.time()
+            for nombre in [n for n, s in self.sesiones.items() if ahora - s.ultimo_uso > self.inactividad]:
+                logger.info(f"Sesión de cámara cerrada por inactividad: {nombre}")
+                del self.sesiones[nombre]
+
+            sesion = self.sesiones.get(usuario)
+            if sesion is None:
+                sesion = self.sesiones[usuario] = SesionCamara(usuario)
+            sesion.ultimo_uso = ahora
+            return sesion
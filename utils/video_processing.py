@@ -1,11 +1,20 @@
 import logging
 import os
+import shutil
+import time
 from datetime import datetime
 
 import cv2
 import torch
 from ultralytics import YOLO
 
+from utils.alert_system import ventana_alertas
+from utils.incidentes import LineaTiempo
+from utils.distance_utils import personas_cerca_de_armas
+from utils.movimiento import DetectorMovimiento, MuestreoAdaptativo
+from utils.ffmpeg_utils import EscritorH264, remux_video
+from utils.metricas import ETAPA_SEGUNDOS, VIDEO_FPS
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -34,6 +43,17 @@ if not hasattr(loss_module, 'DFLoss'):
 MODEL_ARMAS = os.getenv("MODEL_ARMAS", "modelos/weapon_yolov8n.pt")
 MAX_AREA_RATIO = float(os.getenv("MAX_AREA_RATIO", 0.1))
 MARGEN_ARMAS = int(os.getenv("MARGEN_ARMAS", 30))
+MODEL_PERSONAS = os.getenv("MODEL_PERSONAS", "")  # Ej: yolov8n.pt (COCO); vacío desactiva la proximidad
+DISTANCIA_PERSONAS = float(os.getenv("DISTANCIA_PERSONAS", 1.5))  # Metros
+BACKEND_ARMAS = os.getenv("BACKEND_ARMAS", "torch")  # torch | onnx | openvino
+BACKEND_INT8 = os.getenv("BACKEND_INT8", "0") == "1"
+BACKEND_DATOS_INT8 = os.getenv("BACKEND_DATOS_INT8", "")  # YAML de calibración para OpenVINO int8
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+# "original": conserva el bitstream (remux) y guarda las detecciones en sidecars JSON/WebVTT
+# "anotado": además dibuja las cajas y recodifica en H.264 con ffmpeg
+MODO_EVIDENCIA = os.getenv("MODO_EVIDENCIA", "original")
 
 # Definir carpeta de frames
 CARPETA_FRAMES = os.path.join("data", "frames")
@@ -59,117 +79,327 @@ def descargar_modelo_armas(ruta):
         raise
 
 
-def cargar_modelo_seguro(ruta_modelo):
-    """Carga el modelo de forma segura"""
+def ruta_exportada(ruta_pt, backend, int8=False):
+    """Ruta donde queda cacheado el modelo exportado para un backend"""
+    base = os.path.splitext(ruta_pt)[0]
+    sufijo = "_int8" if int8 else ""
+    if backend == "onnx":
+        return f"{base}{sufijo}.onnx"
+    return f"{base}{sufijo}_openvino_model"
+
+
+def exportar_modelo(ruta_pt, backend, int8=False):
+    """Exporta el .pt a ONNX u OpenVINO (opcionalmente int8) y cachea el resultado"""
+    destino = ruta_exportada(ruta_pt, backend, int8)
+    if os.path.exists(destino) and os.path.getmtime(destino) >= os.path.getmtime(ruta_pt):
+        return destino
+
+    logger.info(f"Exportando {ruta_pt} a {backend}{' int8' if int8 else ''}...")
+    modelo = YOLO(ruta_pt)
+    if backend == "onnx":
+        exportado = modelo.export(format="onnx", imgsz=640, simplify=True)
+        if int8:
+            # Cuantización dinámica de pesos: no necesita datos de calibración
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(exportado, destino, weight_type=QuantType.QUInt8)
+            exportado = destino
+    else:
+        opciones = {"data": BACKEND_DATOS_INT8} if int8 and BACKEND_DATOS_INT8 else {}
+        exportado = modelo.export(format="openvino", imgsz=640, int8=int8, **opciones)
+
+    exportado = os.path.normpath(exportado)
+    if exportado != os.path.normpath(destino):
+        if os.path.isdir(destino):
+            shutil.rmtree(destino)
+        shutil.move(exportado, destino)
+
+    logger.info(f"Modelo exportado: {destino}")
+    return destino
+
+
+def cargar_modelo_seguro(ruta_modelo, backend=None, int8=None):
+    """Carga el modelo de forma segura con el backend configurado"""
+    backend = backend or BACKEND_ARMAS
+    int8 = BACKEND_INT8 if int8 is None else int8
+
     # Asegurarse de que existe el modelo
     if "weapon" in ruta_modelo:
         descargar_modelo_armas(ruta_modelo)
 
+    if backend not in BACKENDS:
+        logger.error(f"Backend desconocido '{backend}', usando torch")
+        backend = "torch"
+
+    # Exportar (o reutilizar la exportación cacheada) si el backend no es PyTorch
+    if backend != "torch" and ruta_modelo.endswith(".pt"):
+        try:
+            ruta_modelo = exportar_modelo(ruta_modelo, backend, int8)
+        except Exception as e:
+            logger.error(f"Error exportando a {backend}, usando torch: {str(e)}")
+
     try:
-        return YOLO(ruta_modelo)
+        return YOLO(ruta_modelo, task="detect")
     except Exception as e:
         logger.error(f"Error cargando modelo: {str(e)}")
         raise RuntimeError(f"No se pudo cargar el modelo: {ruta_modelo}")
 
 
-def procesar_video(video_path):
-    # Inicializar modelo de armas
+def extraer_armas(res_armas, forma_frame):
+    """Devuelve las cajas de armas válidas (x1, y1, x2, y2, conf, track_id) de un resultado YOLO"""
+    armas = []
+    if res_armas is None:
+        return armas
+
+    try:
+        if hasattr(res_armas, 'boxes'):
+            for box in res_armas.boxes:
+                conf = box.conf.item()
+                if conf > 0.5:
+                    x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
+                    area = (x2 - x1) * (y2 - y1)
+
+                    # Filtrar armas demasiado grandes
+                    if area / (forma_frame[0] * forma_frame[1]) > MAX_AREA_RATIO:
+                        continue
+
+                    track_id = int(box.id.item()) if box.id is not None else -1
+                    armas.append((x1, y1, x2, y2, conf, track_id))
+    except Exception as e:
+        logger.error(f"Error procesando cajas armas: {str(e)}")
+    return armas
+
+
+def detectar_armas(yolo_armas, frame):
+    """Ejecuta una inferencia con tracking persistente y devuelve las armas del frame"""
+    try:
+        res_armas = yolo_armas.track(frame, persist=True, imgsz=640, conf=0.5, verbose=False)
+        res_armas = res_armas[0] if res_armas else None
+    except Exception as e:
+        logger.error(f"Error en detección de armas: {str(e)}")
+        res_armas = None
+    return extraer_armas(res_armas, frame.shape)
+
+
+def detectar_personas(yolo_personas, frame):
+    """Devuelve un array (N,4) con las cajas de personas del frame"""
     try:
-        yolo_armas = cargar_modelo_seguro(MODEL_ARMAS)
+        res = yolo_personas.predict(frame, classes=[0], imgsz=640, conf=0.4, verbose=False)
+        if res and res[0].boxes is not None:
+            return res[0].boxes.xyxy.cpu().numpy()
+    except Exception as e:
+        logger.error(f"Error en detección de personas: {str(e)}")
+    return []
+
+
+def fin_de_segmento(video_path):
+    """Hora (epoch) en que terminó de grabarse el segmento.
+
+    /upload-video y la ingesta WebSocket nombran el archivo usuario@%Y%m%d_%H%M%S_%f[@lat_lon]
+    con la hora de recepción; ese nombre viaja con el trabajo, así que también vale para clips
+    descargados de B2. Si el nombre no trae la marca se usa el mtime del archivo.
+    """
+    partes = os.path.splitext(os.path.basename(video_path))[0].split("@")
+    marca = partes[1] if len(partes) > 1 else ""
+    for formato in ("%Y%m%d_%H%M%S_%f", "%Y%m%d_%H%M%S"):
+        try:
+            return datetime.strptime(marca, formato).timestamp()
+        except ValueError:
+            continue
+    return os.path.getmtime(video_path)
+
+
+def procesar_video(video_path, camara="unknown", yolo_armas=None):
+    # Inicializar modelo de armas (una sesión de cámara puede pasar el suyo para conservar el tracker)
+    try:
+        if yolo_armas is None:
+            yolo_armas = cargar_modelo_seguro(MODEL_ARMAS)
     except Exception as e:
         logger.error(f"Error crítico cargando modelo: {str(e)}")
         return {"error": str(e)}, ""
 
+    # Modelo de personas opcional para el análisis de proximidad
+    yolo_personas = None
+    if MODEL_PERSONAS:
+        try:
+            yolo_personas = cargar_modelo_seguro(MODEL_PERSONAS)
+        except Exception as e:
+            logger.error(f"Análisis de proximidad desactivado: {str(e)}")
+
     # Resultados
     resultados = {
         "alertas": [],
-        "key_frames": []  # Frames clave para análisis
+        "key_frames": [],  # Frames clave para análisis
+        "escalamientos": []  # Cambios de estado de la alerta de la cámara
     }
 
     # Preparar video de salida
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         logger.error(f"Error abriendo video: {video_path}")
-        return resultados, ""
+        return {"error": f"No se pudo abrir el video {video_path}"}, ""
 
     fps = cap.get(cv2.CAP_PROP_FPS)
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
-    video_salida = f"procesado_{os.path.basename(video_path)}"
-    out = cv2.VideoWriter(
-        video_salida,
-        cv2.VideoWriter_fourcc(*'mp4v'),
-        fps,
-        (width, height)
-    )
+    # Hora real del segmento: el fin viene de la marca de subida del nombre; la duración
+    # de CAP_PROP_FRAME_COUNT es solo una estimación hasta medirla al decodificar
+    fin_segmento = fin_de_segmento(video_path)
+    total_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    duracion = total_frames / fps if fps > 0 and total_frames > 0 else 0
+    inicio_segmento = fin_segmento - duracion
+
+    nombre_video = os.path.splitext(os.path.basename(video_path))[0]
+    video_salida = f"procesado_{nombre_video}.mp4"
+    anotado = MODO_EVIDENCIA == "anotado"
+    out = EscritorH264(video_salida, fps, (width, height)) if anotado else None
 
     frame_count = 0
     res_armas = None
-    arma_detectada = False
-    key_frames = []
+    armas = []
+    linea = LineaTiempo(fps)
+    frames_incidentes = {}  # incidente -> ruta del mejor frame
+    proximidad = {}  # incidente -> máximo de personas cerca del portador
+    detector_movimiento = DetectorMovimiento()
+    muestreo = MuestreoAdaptativo()
+    inferencias = 0
+    nombre_video = os.path.splitext(os.path.basename(video_path))[0]
+    t_decodificacion = t_inferencia = t_codificacion = 0.0
+    ultimo_ms = 0.0
+    t_inicio = time.perf_counter()
 
     while cap.isOpened():
+        t0 = time.perf_counter()
         ret, frame = cap.read()
+        t_decodificacion += time.perf_counter() - t0
         if not ret:
             break
+        ultimo_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
 
         frame_count += 1
         tiempo_actual = frame_count / fps if fps > 0 else frame_count
 
-        # Detección de armas
-        if frame_count % 6 == 0 or res_armas is None:
+        # Detección de armas con muestreo adaptativo según movimiento y tracks activos
+        movimiento = detector_movimiento.hay_movimiento(frame)
+        nueva_inferencia = muestreo.debe_inferir(movimiento) or res_armas is None
+        if nueva_inferencia:
+            inferencias += 1
+            t0 = time.perf_counter()
             try:
                 res_armas = yolo_armas.track(frame, persist=True, imgsz=640, conf=0.5, verbose=False)
                 res_armas = res_armas[0] if res_armas else None
             except Exception as e:
                 logger.error(f"Error en detección de armas: {str(e)}")
                 res_armas = None
-
-        armas = []
-        if res_armas is not None:
-            try:
-                if hasattr(res_armas, 'boxes'):
-                    for box in res_armas.boxes:
-                        conf = box.conf.item()
-                        if conf > 0.5:
-                            x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
-                            area = (x2 - x1) * (y2 - y1)
-
-                            # Filtrar armas demasiado grandes
-                            if area / (frame.shape[0] * frame.shape[1]) > MAX_AREA_RATIO:
-                                continue
-
-                            armas.append((x1, y1, x2, y2, conf))
-                            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 3)
-                            cv2.putText(frame, f"ARMA {conf:.2f}", (x1, y1 - 10),
-                                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            except Exception as e:
-                logger.error(f"Error procesando cajas armas: {str(e)}")
-
-        # Manejo de alertas
-        if armas:
-            arma_detectada = True
-            resultados["alertas"].append({
-                "tiempo": tiempo_actual,
-                "tipo": "armaDetectada",
-                "confianza": armas[0][4]
-            })
-
-            # Guardar frame clave (máximo 3)
-            if len(key_frames) < 3:
-                os.makedirs(CARPETA_FRAMES, exist_ok=True)
-                frame_name = f"frame_{frame_count}.jpg"
-                frame_path = os.path.join(CARPETA_FRAMES, frame_name)
-                cv2.imwrite(frame_path, frame)
-                key_frames.append(frame_path)
-                resultados["key_frames"] = key_frames
-
-        # Guardar frame procesado
-        out.write(frame)
+            t_inferencia += time.perf_counter() - t0
+            armas = extraer_armas(res_armas, frame.shape)
+            muestreo.registrar(armas, movimiento)
+
+            # Escalamiento por ventana deslizante (por cámara, compartida entre segmentos)
+            hora = inicio_segmento + tiempo_actual
+            if armas:
+                cambio = ventana_alertas.registrar(camara, "armaDetectada", hora)
+            else:
+                cambio = ventana_alertas.actualizar(camara, "armaDetectada", hora)
+            if cambio:
+                resultados["escalamientos"].append({
+                    "tiempo": tiempo_actual,
+                    "tipo": "armaDetectada",
+                    "estado": cambio
+                })
+
+        # Registrar solo las detecciones nuevas (no las cajas reutilizadas)
+        if nueva_inferencia:
+            for x1, y1, x2, y2, conf, track_id in armas:
+                incidente, es_mejor = linea.agregar(frame_count, track_id, (x1, y1, x2, y2), conf)
+
+                # Guardar el mejor frame de cada incidente
+                if es_mejor:
+                    os.makedirs(CARPETA_FRAMES, exist_ok=True)
+                    frame_path = os.path.join(CARPETA_FRAMES, f"frame_{nombre_video}_{incidente}.jpg")
+                    cv2.imwrite(frame_path, frame)
+                    frames_incidentes[incidente] = frame_path
+
+            # Personas a menos de DISTANCIA_PERSONAS del portador del arma
+            if armas and yolo_personas is not None:
+                personas = detectar_personas(yolo_personas, frame)
+                cercanos = personas_cerca_de_armas(personas, [a[:4] for a in armas],
+                                                   frame.shape, DISTANCIA_PERSONAS)
+                cantidad = len({j for _, j, _ in cercanos})
+                proximidad[incidente] = max(proximidad.get(incidente, 0), cantidad)
+
+        # Cajas quemadas en el video solo en modo "anotado" (si no, van en el sidecar).
+        # Se dibujan al final: personas y frames clave usan el frame limpio
+        if anotado:
+            for x1, y1, x2, y2, conf, _ in armas:
+                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 3)
+                cv2.putText(frame, f"ARMA {conf:.2f}", (x1, y1 - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+
+            # Guardar frame procesado
+            t0 = time.perf_counter()
+            out.write(frame)
+            t_codificacion += time.perf_counter() - t0
 
     # Finalizar
     cap.release()
-    out.release()
+    t0 = time.perf_counter()
+    if anotado and not out.release():
+        # ffmpeg falló a mitad del video anotado: se entrega el original (las cajas van en el sidecar)
+        anotado = False
+    if not anotado and not remux_video(video_path, video_salida):
+        # Contenedor/códec que no admite remux a MP4: se conserva el archivo tal cual
+        video_salida = f"procesado_{os.path.basename(video_path)}"
+        shutil.copyfile(video_path, video_salida)
+    t_codificacion += time.perf_counter() - t0
+
+    # Detecciones como sidecar para que el visor las superponga
+    resultados["sidecar"] = {
+        "json": linea.guardar_json(f"procesado_{nombre_video}.json", width, height),
+        "vtt": linea.guardar_webvtt(f"procesado_{nombre_video}.vtt")
+    }
+    resultados["alerta_activa"] = ventana_alertas.activa(camara, "armaDetectada")
+    # Duración medida al decodificar (los webm de MediaRecorder no traen conteo de frames fiable)
+    if ultimo_ms > 0:
+        duracion = ultimo_ms / 1000 + (1 / fps if fps > 0 else 0)
+    elif fps > 0 and frame_count:
+        duracion = frame_count / fps
+    resultados["duracion"] = duracion
+    resultados["inicio_segmento"] = fin_segmento - duracion
+    logger.info(f"Inferencias YOLO: {inferencias} de {frame_count} frames")
+
+    # Tiempo por fase y fps del clip
+    t_total = time.perf_counter() - t_inicio
+    ETAPA_SEGUNDOS.observe(t_decodificacion, etapa="yolo_decodificacion")
+    ETAPA_SEGUNDOS.observe(t_inferencia, etapa="yolo_inferencia")
+    ETAPA_SEGUNDOS.observe(t_codificacion, etapa="yolo_codificacion")
+    ETAPA_SEGUNDOS.observe(t_total, etapa="yolo_total")
+    if t_total > 0:
+        VIDEO_FPS.observe(frame_count / t_total, fase="total")
+    if t_inferencia > 0:
+        VIDEO_FPS.observe(inferencias / t_inferencia, fase="inferencia")
+    resultados["metricas"] = {
+        "frames": frame_count,
+        "inferencias": inferencias,
+        "decodificacion_s": round(t_decodificacion, 3),
+        "inferencia_s": round(t_inferencia, 3),
+        "codificacion_s": round(t_codificacion, 3),
+        "total_s": round(t_total, 3)
+    }
+
+    # Solo el resumen por incidente sale del procesamiento
+    incidentes = linea.incidentes("armaDetectada")
+    for i, cantidad in proximidad.items():
+        incidentes[i]["personas_cercanas"] = cantidad
+    resultados["alertas"] = incidentes
+
+    # Frames clave: el mejor frame de los 3 incidentes más confiables
+    orden = sorted(range(len(incidentes)), key=lambda i: incidentes[i]["confianza"], reverse=True)
+    for i in orden[3:]:
+        try:
+            os.remove(frames_incidentes.pop(i))
+        except (KeyError, OSError):
+            pass
+    resultados["key_frames"] = [frames_incidentes[i] for i in orden[:3] if i in frames_incidentes]
 
     return resultados, video_salida
\ No newline at end of file